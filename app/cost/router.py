@@ -20,6 +20,7 @@ SIMPLE_PATTERNS = [
     r'^define \w+\?*$',
 ]
 
+# context_budget — max prompt tokens (memory + user message) the context packer may fill
 MODEL_CONFIG = {
     "simple": {
         "model_id":    "llama-3.1-8b-instant",
@@ -27,6 +28,7 @@ MODEL_CONFIG = {
         "cost_input":  0.00000005,
         "cost_output": 0.00000008,
         "max_tokens":  512,
+        "context_budget": 1000,
     },
     "medium": {
         "model_id":    "llama-3.3-70b-versatile",
@@ -34,6 +36,7 @@ MODEL_CONFIG = {
         "cost_input":  0.00000059,
         "cost_output": 0.00000079,
         "max_tokens":  1000,
+        "context_budget": 3000,
     },
     "complex": {
         "model_id":    "llama-3.3-70b-versatile",
@@ -41,6 +44,7 @@ MODEL_CONFIG = {
         "cost_input":  0.00000059,
         "cost_output": 0.00000079,
         "max_tokens":  2000,
+        "context_budget": 6000,
     },
 }
 
@@ -0,0 +1,255 @@
+import asyncio
+import fcntl
+import glob
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from postgrest.exceptions import APIError
+from app.utils.db import get_supabase
+from app.utils.metrics import Histogram
+
+# ── Buffered cost_logs writer ─────────────────────────────────
+# Rows are buffered in memory and written with one bulk insert every
+# COST_LOG_FLUSH_ROWS rows or COST_LOG_FLUSH_MS, whichever comes first.
+# Every buffered row is also appended to a per-process spill file; the file
+# is rewritten after each successful flush, so after a crash it holds
+# exactly the rows that never reached Postgres. Spill files are flock'ed by
+# their owner — a file nobody holds belongs to a dead worker and is replayed.
+#
+# Rows Postgres rejects (data / constraint errors) are isolated by bisecting
+# the batch and moved to the dead-letter file; transient failures back off
+# and are retried up to COST_LOG_MAX_RETRIES times before the batch is
+# dead-lettered too. Replay it with `python -m scripts.replay_cost_dead_letters`.
+
+COST_LOG_FLUSH_ROWS  = int(os.getenv("COST_LOG_FLUSH_ROWS", 50))
+COST_LOG_FLUSH_MS    = float(os.getenv("COST_LOG_FLUSH_MS", 2000))
+COST_LOG_SPILL_DIR   = os.getenv("COST_LOG_SPILL_DIR", "./cost_spill")
+COST_LOG_MAX_BUFFER  = int(os.getenv("COST_LOG_MAX_BUFFER", 10000))
+COST_LOG_MAX_RETRIES = int(os.getenv("COST_LOG_MAX_RETRIES", 20))
+COST_LOG_MAX_BACKOFF = float(os.getenv("COST_LOG_MAX_BACKOFF_MS", 60000))
+
+DEAD_LETTER_FILE = "cost_logs_dead_letter.jsonl"   # deliberately outside the cost_logs.*.jsonl glob
+
+def _is_poison(error: APIError) -> bool:
+    """Postgres rejected the data itself (SQLSTATE 22xxx / 23xxx) — retrying won't help"""
+    return str(error.code or "")[:2] in ("22", "23")
+
+class _Unwritten(Exception):
+    """A transient failure, carrying the rows that still need writing"""
+    def __init__(self, rows: list, error: Exception):
+        super().__init__(str(error))
+        self.rows  = rows
+        self.error = error
+
+class CostLogSink:
+    def __init__(self, flush_rows: int = COST_LOG_FLUSH_ROWS, flush_ms: float = COST_LOG_FLUSH_MS, spill_dir: str = COST_LOG_SPILL_DIR):
+        self.flush_rows = flush_rows
+        self.flush_ms   = flush_ms
+        self.spill_dir  = spill_dir
+        self._buffer     = []
+        self._flush_lock = asyncio.Lock()
+        self._timer      = None
+        self._size_flush = None
+        self._spill      = None
+        self._spill_path = None
+        # Spill writes run off the event loop, one at a time in submission order
+        self._io         = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cost-spill")
+        self._retries    = 0
+        self._retry_at   = 0.0
+
+        self.rows_flushed  = 0
+        self.rows_dead     = 0
+        self.flush_errors  = 0
+        self.flush_latency = Histogram([5, 10, 25, 50, 100, 250, 500, 1000, 2500])   # ms
+        self.flush_sizes   = Histogram([1, 5, 10, 25, 50, 100, 250, 500])
+
+    # ── Spill file ────────────────────────────────────────────
+    def _open_spill(self):
+        # Created and locked under a name recovery never globs, then renamed
+        # into place — a spill file is never visible unlocked
+        tmp_path    = self._spill_path + ".tmp"
+        self._spill = open(tmp_path, "w", encoding="utf-8")
+        fcntl.flock(self._spill, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.rename(tmp_path, self._spill_path)
+
+    def _recover_orphans(self) -> list:
+        """Rows from spill files whose owning process is gone (incl. a previous run with our pid)"""
+        rows = []
+        for path in glob.glob(os.path.join(self.spill_dir, "cost_logs.*.jsonl")):
+            try:
+                f = open(path, "r+", encoding="utf-8")
+            except FileNotFoundError:
+                continue   # another worker just recovered it
+            with f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue   # a live worker owns it
+                rows.extend(json.loads(line) for line in f if line.strip())
+                # Only unlink the file we read — a new owner may have renamed
+                # a fresh spill file onto this path meanwhile
+                try:
+                    if os.stat(path).st_ino == os.fstat(f.fileno()).st_ino:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return rows
+
+    def _write_spill(self, rows: list, rewrite: bool):
+        """Append rows to the spill file, or replace its contents with them"""
+        if not self._spill:
+            return
+        if rewrite:
+            self._spill.seek(0)
+            self._spill.truncate()
+        for row in rows:
+            self._spill.write(json.dumps(row) + "\n")
+        self._spill.flush()
+
+    async def _spill_io(self, rows: list, rewrite: bool = False):
+        await asyncio.get_running_loop().run_in_executor(self._io, self._write_spill, rows, rewrite)
+
+    def _write_dead_letters(self, rows: list, reason: str):
+        with open(os.path.join(self.spill_dir, DEAD_LETTER_FILE), "a", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            for row in rows:
+                f.write(json.dumps({"row": row, "reason": reason}) + "\n")
+
+    async def _dead_letter(self, rows: list, reason: str):
+        self.rows_dead += len(rows)
+        print(f"⚠️ Dead-lettered {len(rows)} cost logs: {reason}")
+        await asyncio.get_running_loop().run_in_executor(self._io, self._write_dead_letters, rows, reason)
+
+    # ── Lifecycle ─────────────────────────────────────────────
+    async def start(self):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self._spill_path = os.path.join(self.spill_dir, f"cost_logs.{os.getpid()}.jsonl")
+        recovered = await asyncio.to_thread(self._recover_orphans)
+        await asyncio.to_thread(self._open_spill)
+        if recovered:
+            self._buffer.extend(recovered)
+            await self._spill_io(list(self._buffer), rewrite=True)
+            print(f"✅ Recovered {len(recovered)} unflushed cost logs")
+        self._timer = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        if self._timer:
+            self._timer.cancel()
+            await asyncio.gather(self._timer, return_exceptions=True)
+        self._retry_at = 0.0
+        await self.flush()
+        if self._spill:
+            await asyncio.get_running_loop().run_in_executor(self._io, self._spill.close)
+            if not self._buffer:
+                os.remove(self._spill_path)
+        self._io.shutdown(wait=True)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_ms / 1000)
+            await self.flush()
+
+    # ── Writes ────────────────────────────────────────────────
+    async def add(self, row: dict):
+        """Buffer one row — written to Postgres on the next flush"""
+        self._buffer.append(row)
+        await self._spill_io([row])
+
+        if len(self._buffer) > COST_LOG_MAX_BUFFER and not self._flush_lock.locked():
+            # Postgres has been unreachable for a while — keep memory bounded
+            overflow, self._buffer = self._buffer[:self.flush_rows], self._buffer[self.flush_rows:]
+            await self._dead_letter(overflow, "buffer full")
+            await self._spill_io(list(self._buffer), rewrite=True)
+
+        if len(self._buffer) >= self.flush_rows and not self._flush_lock.locked() and time.time() >= self._retry_at:
+            self._size_flush = asyncio.create_task(self.flush())
+
+    async def _insert(self, supabase, rows: list) -> int:
+        """Insert rows, bisecting around rows Postgres rejects — returns how many were written.
+
+        Raises _Unwritten on a transient error; rows written before it are
+        already counted in rows_flushed.
+        """
+        try:
+            # Inserts the raw rows and bumps cost_daily_rollups in one transaction
+            await supabase.rpc("insert_cost_logs", {"rows": rows}).execute()
+            self.rows_flushed += len(rows)
+            return len(rows)
+        except APIError as e:
+            if not _is_poison(e):
+                raise _Unwritten(rows, e)
+            if len(rows) == 1:
+                await self._dead_letter(rows, f"{e.code}: {e.message}")
+                return 0
+        except Exception as e:
+            raise _Unwritten(rows, e)
+
+        mid = len(rows) // 2
+        try:
+            written = await self._insert(supabase, rows[:mid])
+        except _Unwritten as u:
+            raise _Unwritten(u.rows + rows[mid:], u.error)
+        return written + await self._insert(supabase, rows[mid:])
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._buffer or time.time() < self._retry_at:
+                return
+            rows, self._buffer = self._buffer, []
+            start = time.perf_counter()
+            try:
+                supabase = await get_supabase()
+                written  = await self._insert(supabase, rows)
+            except _Unwritten as u:
+                self.flush_errors += 1
+                self._retries     += 1
+                if self._retries >= COST_LOG_MAX_RETRIES:
+                    await self._dead_letter(u.rows, f"gave up after {self._retries} attempts: {u.error}")
+                    self._retries, self._retry_at = 0, 0.0
+                else:
+                    # Keep the rows (still in the spill file) and back off
+                    self._buffer   = u.rows + self._buffer
+                    self._retry_at = time.time() + min(self.flush_ms * 2 ** self._retries, COST_LOG_MAX_BACKOFF) / 1000
+                    print(f"⚠️ Cost log flush of {len(rows)} rows failed (attempt {self._retries}): {u.error}")
+                await self._spill_io(list(self._buffer), rewrite=True)
+                return
+
+            self._retries, self._retry_at = 0, 0.0
+            self.flush_latency.observe((time.perf_counter() - start) * 1000)
+            self.flush_sizes.observe(written)
+            await self._spill_io(list(self._buffer), rewrite=True)
+
+    def stats(self) -> dict:
+        return {
+            "buffer_depth":     len(self._buffer),
+            "rows_flushed":     self.rows_flushed,
+            "rows_dead":        self.rows_dead,
+            "flush_errors":     self.flush_errors,
+            "flush_latency_ms": self.flush_latency.snapshot(),
+            "flush_size":       self.flush_sizes.snapshot(),
+        }
+
+cost_log_sink = CostLogSink()
+
+async def replay_dead_letters(spill_dir: str = COST_LOG_SPILL_DIR) -> dict:
+    """Re-insert dead-lettered rows one by one — rows that still fail stay in the file"""
+    path = os.path.join(spill_dir, DEAD_LETTER_FILE)
+    if not os.path.exists(path):
+        return {"replayed": 0, "remaining": 0}
+
+    supabase = await get_supabase()
+    with open(path, "r+", encoding="utf-8") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        entries   = [json.loads(line) for line in f if line.strip()]
+        remaining = []
+        for entry in entries:
+            try:
+                await supabase.rpc("insert_cost_logs", {"rows": [entry["row"]]}).execute()
+            except Exception as e:
+                remaining.append({"row": entry["row"], "reason": str(e)})
+        f.seek(0)
+        f.truncate()
+        for entry in remaining:
+            f.write(json.dumps(entry) + "\n")
+    return {"replayed": len(entries) - len(remaining), "remaining": len(remaining)}
@@ -1,13 +1,11 @@
-import os
 import uuid
-from datetime import datetime
-from supabase import create_client
-from app.utils.token_counter import count_tokens, calculate_cost
-
-supabase = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_KEY")
-)
+import json
+import base64
+import asyncio
+from datetime import datetime, timezone
+from app.utils.db import get_supabase
+from app.cost.sink import cost_log_sink
+from app.utils.token_counter import count_tokens, message_tokens, calculate_cost
 
 async def log_query_cost(
     user_id: str,
@@ -19,18 +17,32 @@ async def log_query_cost(
     longterm_context: str = "",
     model: str = "llama3-70b-groq",
     memory_hit: bool = False,
-    memory_layer_used: str = None
+    memory_layer_used: str = None,
+    response_tokens: int = None,
+    session_summary: str = "",
+    user_tokens: int = None,
+    session_summary_tokens: int = None
 ):
-    """Log complete cost breakdown for one query"""
+    """Log complete cost breakdown for one query.
+
+    Pass `response_tokens` / `user_tokens` when the counts are already known
+    (e.g. from the model's usage) to skip re-tokenizing. Working-memory
+    messages use their stored counts. A rolling `session_summary` is counted
+    as working memory, from `session_summary_tokens` when it was stored.
+    """
     
     # Count tokens for each layer
     working_tokens = sum(
-        count_tokens(m["content"]) for m in working_memory_messages
+        message_tokens(m) for m in working_memory_messages
     )
+    if session_summary:
+        working_tokens += session_summary_tokens if session_summary_tokens is not None else count_tokens(session_summary)
     episodic_tokens = count_tokens(episodic_context)
     longterm_tokens = count_tokens(longterm_context)
-    user_tokens = count_tokens(user_message)
-    response_tokens = count_tokens(response_text)
+    if user_tokens is None:
+        user_tokens = count_tokens(user_message)
+    if response_tokens is None:
+        response_tokens = count_tokens(response_text)
     
     total_input_tokens = working_tokens + episodic_tokens + longterm_tokens + user_tokens
     
@@ -51,6 +63,8 @@ async def log_query_cost(
     log = {
         "user_id": user_id,
         "query_id": str(uuid.uuid4()),
+        # Stamped here, not by the DB default — the row may be flushed later
+        "timestamp": datetime.now(timezone.utc).isoformat(),
         "session_id": session_id,
         "working_memory_tokens": working_tokens,
         "episodic_memory_tokens": episodic_tokens,
@@ -67,23 +81,45 @@ async def log_query_cost(
         "memory_layer_used": memory_layer_used
     }
     
-    supabase.table("cost_logs").insert(log).execute()
+    # Buffered — written in bulk by the sink, off the request path
+    await cost_log_sink.add(log)
     return log
 
+# Columns the dashboard needs from raw rows — everything else comes from rollups
+RECENT_LOG_COLUMNS = (
+    "query_id,session_id,timestamp,working_memory_tokens,episodic_memory_tokens,"
+    "longterm_memory_tokens,user_message_tokens,response_tokens,total_tokens,"
+    "actual_cost,naive_cost,cost_saved,savings_percent,model_used,memory_hit,memory_layer_used"
+)
+
 async def get_cost_analytics(user_id: str, days: int = 30) -> dict:
-    """Get aggregated cost analytics for dashboard"""
-    from datetime import datetime, timedelta
+    """Get aggregated cost analytics for dashboard — totals come from daily rollups"""
+    from datetime import timedelta
+
+    supabase = await get_supabase()
+    since    = (datetime.now(timezone.utc) - timedelta(days=days)).date().isoformat()
 
-    result = supabase.table("cost_logs")\
+    rollup_query = supabase.table("cost_daily_rollups")\
         .select("*")\
         .eq("user_id", user_id)\
-        .order("timestamp", desc=False)\
-        .limit(500)\
+        .gte("day", since)\
+        .order("day", desc=False)\
         .execute()
 
-    logs = result.data
+    # Only the recent raw rows — for the per-query token chart and log table
+    recent_query = supabase.table("cost_logs")\
+        .select(RECENT_LOG_COLUMNS)\
+        .eq("user_id", user_id)\
+        .gte("timestamp", since)\
+        .order("timestamp", desc=True)\
+        .limit(50)\
+        .execute()
+
+    rollup_result, recent_result = await asyncio.gather(rollup_query, recent_query)
+    rollups = rollup_result.data
+    logs    = list(reversed(recent_result.data))
 
-    if not logs:
+    if not rollups:
         return {
             "total_cost": 0,
             "total_saved": 0,
@@ -96,23 +132,23 @@ async def get_cost_analytics(user_id: str, days: int = 30) -> dict:
             "model_usage": []
         }
 
-    total_cost = sum(l["actual_cost"] or 0 for l in logs)
-    total_saved = sum(l["cost_saved"] or 0 for l in logs)
-    total_queries = len(logs)
-    avg_savings = sum(l["savings_percent"] or 0 for l in logs) / total_queries
-    memory_hits = sum(1 for l in logs if l["memory_hit"])
+    total_cost = sum(r["actual_cost"] for r in rollups)
+    total_saved = sum(r["cost_saved"] for r in rollups)
+    total_queries = sum(r["queries"] for r in rollups)
+    avg_savings = sum(r["savings_percent_sum"] for r in rollups) / total_queries if total_queries else 0
+    memory_hits = sum(r["memory_hits"] for r in rollups)
     memory_hit_rate = (memory_hits / total_queries * 100) if total_queries > 0 else 0
 
-    # Daily breakdown for bar chart
+    # Daily breakdown for bar chart (rollups are per model — merge per day)
     daily = {}
-    for log in logs:
-        day = log["timestamp"][:10]  # YYYY-MM-DD
+    for r in rollups:
+        day = r["day"]
         if day not in daily:
             daily[day] = {"date": day, "actual_cost": 0, "naive_cost": 0, "queries": 0, "tokens": 0}
-        daily[day]["actual_cost"] += log["actual_cost"] or 0
-        daily[day]["naive_cost"] += log["naive_cost"] or 0
-        daily[day]["queries"] += 1
-        daily[day]["tokens"] += log["total_tokens"] or 0
+        daily[day]["actual_cost"] += r["actual_cost"]
+        daily[day]["naive_cost"] += r["naive_cost"]
+        daily[day]["queries"] += r["queries"]
+        daily[day]["tokens"] += r["total_tokens"]
 
     daily_breakdown = list(daily.values())[-14:]  # last 14 days
 
@@ -129,9 +165,8 @@ async def get_cost_analytics(user_id: str, days: int = 30) -> dict:
 
     # Model usage for pie chart
     model_counts = {}
-    for log in logs:
-        model = log["model_used"] or "unknown"
-        model_counts[model] = model_counts.get(model, 0) + 1
+    for r in rollups:
+        model_counts[r["model_used"]] = model_counts.get(r["model_used"], 0) + r["queries"]
 
     model_usage = [{"name": k, "value": v} for k, v in model_counts.items()]
 
@@ -141,8 +176,69 @@ async def get_cost_analytics(user_id: str, days: int = 30) -> dict:
         "total_queries": total_queries,
         "avg_savings_percent": round(avg_savings, 2),
         "memory_hit_rate": round(memory_hit_rate, 2),
-        "logs": logs[-50:],
+        "logs": logs,
         "daily_breakdown": daily_breakdown,
         "token_breakdown": token_breakdown,
         "model_usage": model_usage
-    }
\ No newline at end of file
+    }
+
+# ── Keyset pagination over cost_logs ──────────────────────────
+# Pages are ordered by (timestamp, query_id); the cursor is the last row's
+# pair, so each page is an index range scan no matter how deep it is.
+
+def encode_cursor(row: dict) -> str:
+    raw = json.dumps([row["timestamp"], row["query_id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    """Raises ValueError on a malformed cursor"""
+    try:
+        timestamp, query_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return timestamp, query_id
+
+async def list_cost_logs(
+    user_id: str,
+    limit: int = 50,
+    cursor: str = None,
+    ascending: bool = False,
+    columns: str = RECENT_LOG_COLUMNS
+) -> dict:
+    """One page of a user's cost logs — newest first unless `ascending`"""
+    supabase = await get_supabase()
+    query = supabase.table("cost_logs")\
+        .select(columns)\
+        .eq("user_id", user_id)
+
+    if cursor:
+        timestamp, query_id = decode_cursor(cursor)
+        op = "gt" if ascending else "lt"
+        query = query.or_(
+            f'timestamp.{op}."{timestamp}",'
+            f'and(timestamp.eq."{timestamp}",query_id.{op}.{query_id})'
+        )
+
+    # One extra row tells us whether there is a next page
+    result = await query\
+        .order("timestamp", desc=not ascending)\
+        .order("query_id", desc=not ascending)\
+        .limit(limit + 1)\
+        .execute()
+
+    rows = result.data
+    return {
+        "logs": rows[:limit],
+        "next_cursor": encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    }
+
+async def iter_cost_logs(user_id: str, page_size: int = 1000, columns: str = RECENT_LOG_COLUMNS):
+    """Yield a user's full log history page by page, oldest first — constant memory"""
+    cursor = None
+    while True:
+        page = await list_cost_logs(user_id, limit=page_size, cursor=cursor, ascending=True, columns=columns)
+        if page["logs"]:
+            yield page["logs"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            return
@@ -1,13 +1,29 @@
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from app.routes import chat, memory, cost, keys
+from app.routes import chat, memory, cost, keys, metrics
+from app.memory.jobs import start_job_workers, stop_job_workers
+from app.memory.maintenance import start_maintenance, stop_maintenance
+from app.utils.groq_clients import close_groq_clients
+from app.cost.sink import cost_log_sink
 
-app = FastAPI(title="MemVault API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await cost_log_sink.start()
+    await start_job_workers()
+    await start_maintenance()
+    yield
+    await stop_maintenance()
+    await stop_job_workers()
+    await cost_log_sink.stop()
+    await close_groq_clients()
+
+app = FastAPI(title="MemVault API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +41,7 @@ app.include_router(chat.router,   prefix="/api")
 app.include_router(memory.router, prefix="/api")
 app.include_router(cost.router,   prefix="/api")
 app.include_router(keys.router,   prefix="/api")
+app.include_router(metrics.router, prefix="/api")
 
 @app.get("/")
 def health_check():
@@ -0,0 +1,84 @@
+import asyncio
+import os
+import time
+
+from app.memory.working import get_working_memory_and_summary
+from app.memory.episodic import get_recent_episodic_memories
+from app.memory.longterm import get_embedding, search_longterm_memory_scored
+from app.memory.episodic_index import search_episodic_memories
+
+# Max seconds to wait on any single memory layer before answering without it
+CONTEXT_LAYER_TIMEOUT = float(os.getenv("CONTEXT_LAYER_TIMEOUT", 2.0))
+
+async def _fetch_layer(name: str, coro, timeout: float) -> tuple:
+    """Run one layer fetch with a timeout — returns (result, timing)"""
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(coro, timeout)
+        status = "ok"
+    except asyncio.TimeoutError:
+        result, status = [], "timeout"
+    except Exception as e:
+        print(f"⚠️ {name} memory unavailable: {e}")
+        result, status = [], "error"
+
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+    return result, {"ms": elapsed_ms, "status": status}
+
+def _task_result(task: asyncio.Task):
+    """A finished task's result, or None if it is pending, cancelled or failed"""
+    if not task.done() or task.cancelled() or task.exception():
+        return None
+    return task.result()
+
+async def assemble_context(
+    user_id: str,
+    session_id: str,
+    query: str,
+    episodic_limit: int = 3,
+    longterm_top_k: int = 3,
+    timeout: float = CONTEXT_LAYER_TIMEOUT
+) -> dict:
+    """Fetch working, episodic and long-term memory concurrently.
+
+    A layer that errors or exceeds its timeout comes back empty instead
+    of failing the request; its status is recorded in `timings`.
+    """
+    # One query embedding shared by both vector layers, kept for later
+    # stages (e.g. the response cache). Shielded so a layer timing out
+    # doesn't cancel it for the other.
+    embed_task = asyncio.ensure_future(get_embedding(query))
+
+    async def _search_longterm():
+        query_embedding = await asyncio.shield(embed_task)
+        return await search_longterm_memory_scored(user_id, query, top_k=longterm_top_k, query_embedding=query_embedding)
+
+    async def _search_episodic():
+        query_embedding = await asyncio.shield(embed_task)
+        ranked = await search_episodic_memories(user_id, query_embedding, top_k=episodic_limit)
+        # Not indexed yet (pre-backfill) — fall back to the newest rows
+        return ranked or await get_recent_episodic_memories(user_id, limit=episodic_limit)
+
+    (working, working_t), (episodic, episodic_t), (longterm, longterm_t) = await asyncio.gather(
+        _fetch_layer("working",  get_working_memory_and_summary(user_id, session_id), timeout),
+        _fetch_layer("episodic", _search_episodic(), timeout),
+        _fetch_layer("longterm", _search_longterm(), timeout),
+    )
+
+    working, session_summary, session_summary_tokens = working or ([], None, None)
+    timings = {"working": working_t, "episodic": episodic_t, "longterm": longterm_t}
+    print(f"⏱️ context for user {user_id}: " + ", ".join(
+        f"{name}={t['ms']}ms" + ("" if t["status"] == "ok" else f" ({t['status']})")
+        for name, t in timings.items()
+    ))
+
+    return {
+        "working":  working,
+        "session_summary": session_summary,
+        "session_summary_tokens": session_summary_tokens,
+        "episodic": episodic or [],
+        "longterm": [fact for fact, _ in longterm or []],
+        "longterm_scored": longterm or [],
+        "timings":  timings,
+        "query_embedding": _task_result(embed_task),
+    }
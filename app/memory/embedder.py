@@ -0,0 +1,55 @@
+import os
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+# ── Embedding model + inference backend ───────────────────────
+# torch       full-precision PyTorch (default)
+# torch-int8  PyTorch with dynamic int8 quantization of the Linear layers
+# onnx        ONNX Runtime export of the same model
+# onnx-int8   ONNX Runtime, int8-quantized export (EMBEDDING_ONNX_FILE)
+# The onnx backends need `pip install optimum[onnxruntime]`.
+
+EMBEDDING_MODEL     = 'all-MiniLM-L6-v2'
+EMBEDDING_BACKEND   = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+def load_embedder(backend: str = EMBEDDING_BACKEND) -> SentenceTransformer:
+    """Load all-MiniLM-L6-v2 on the requested CPU backend"""
+    if backend == "torch":
+        return SentenceTransformer(EMBEDDING_MODEL)
+
+    if backend == "torch-int8":
+        import torch
+        model = SentenceTransformer(EMBEDDING_MODEL)
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    if backend == "onnx":
+        return SentenceTransformer(EMBEDDING_MODEL, backend="onnx")
+
+    if backend == "onnx-int8":
+        return SentenceTransformer(
+            EMBEDDING_MODEL,
+            backend="onnx",
+            model_kwargs={"file_name": EMBEDDING_ONNX_FILE}
+        )
+
+    raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}' — expected one of {EMBEDDING_BACKENDS}")
+
+def embedder_cache_name(backend: str = EMBEDDING_BACKEND) -> str:
+    """Cache namespace — vectors from different backends aren't bit-identical"""
+    return EMBEDDING_MODEL if backend == "torch" else f"{EMBEDDING_MODEL}:{backend}"
+
+def cosine_agreement(reference, candidate) -> dict:
+    """Row-wise cosine similarity between two embedding matrices of the same texts"""
+    a = np.asarray(reference, dtype=np.float32)
+    b = np.asarray(candidate, dtype=np.float32)
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    cos = np.sum(a * b, axis=1)
+    return {
+        "mean": round(float(cos.mean()), 5),
+        "min":  round(float(cos.min()), 5),
+        "p05":  round(float(np.percentile(cos, 5)), 5),
+    }
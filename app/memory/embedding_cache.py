@@ -0,0 +1,120 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# ── Content-addressed embedding cache ─────────────────────────
+# In-process LRU bounded by bytes, optionally backed by a SQLite file of
+# float32 vectors keyed by (model name, sha256 of text). The disk layer
+# survives restarts and is shared by every worker on the same machine.
+
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+EMBEDDING_CACHE_DIR       = os.getenv("EMBEDDING_CACHE_DIR")   # unset → memory only
+
+# Rough per-entry overhead of the key + OrderedDict slot
+_ENTRY_OVERHEAD = 200
+
+class EmbeddingCache:
+    def __init__(self, model_name: str, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES, cache_dir: str = EMBEDDING_CACHE_DIR):
+        self.model_name = model_name
+        self.max_bytes  = max_bytes
+        self._entries   = OrderedDict()
+        self._bytes     = 0
+        self._lock      = threading.Lock()
+        self._conn      = None
+        self.hits       = 0
+        self.disk_hits  = 0
+        self.misses     = 0
+        self.evictions  = 0
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._conn = sqlite3.connect(
+                os.path.join(cache_dir, "embeddings.db"),
+                timeout=30, isolation_level=None, check_same_thread=False
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_memory(self, text: str):
+        """In-process lookup only — cheap enough to call on the event loop"""
+        key = self.text_hash(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        return vector
+
+    def get(self, text: str):
+        """Memory, then disk — returns a float32 vector or None (counts a miss)"""
+        vector = self.get_memory(text)
+        if vector is not None:
+            return vector
+
+        if self._conn is not None:
+            key = self.text_hash(text)
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND text_hash = ?",
+                    (self.model_name, key)
+                ).fetchone()
+            if row:
+                vector = np.frombuffer(row[0], dtype=np.float32)
+                self._remember(key, vector)
+                with self._lock:
+                    self.disk_hits += 1
+                return vector
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text: str, vector):
+        key    = self.text_hash(text)
+        vector = np.asarray(vector, dtype=np.float32)
+        self._remember(key, vector)
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                    (self.model_name, key, vector.tobytes())
+                )
+
+    def _remember(self, key: str, vector: np.ndarray):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = vector
+            self._bytes += vector.nbytes + _ENTRY_OVERHEAD
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes + _ENTRY_OVERHEAD
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "model":      self.model_name,
+                "entries":    len(self._entries),
+                "bytes":      self._bytes,
+                "max_bytes":  self.max_bytes,
+                "hits":       self.hits,
+                "disk_hits":  self.disk_hits,
+                "misses":     self.misses,
+                "evictions":  self.evictions,
+                "hit_rate":   round((self.hits + self.disk_hits) / lookups * 100, 2) if lookups else 0,
+                "disk":       self._conn is not None,
+            }
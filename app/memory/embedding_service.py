@@ -0,0 +1,82 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.metrics import Histogram
+
+# ── Cross-request micro-batching for the embedder ─────────────
+# Concurrent get_embedding calls are queued, collected for up to
+# EMBEDDING_BATCH_WAIT_MS (or EMBEDDING_BATCH_SIZE texts) and encoded in
+# one forward pass on a dedicated thread. Each caller awaits its own future.
+
+EMBEDDING_BATCH_SIZE    = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", 5))
+
+class EmbeddingBatcher:
+    def __init__(self, encode_batch, max_batch_size: int = EMBEDDING_BATCH_SIZE, max_wait_ms: float = EMBEDDING_BATCH_WAIT_MS):
+        """`encode_batch(texts) -> vectors` is called on the dedicated model thread"""
+        self.encode_batch   = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait       = max_wait_ms / 1000
+        self._executor      = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedder")
+        self._queue         = asyncio.Queue()
+        self._collector     = None
+
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.queue_wait  = Histogram([0.5, 1, 2, 5, 10, 25, 50, 100, 250])   # ms
+
+    async def embed(self, text: str):
+        """Queue one text and wait for its vector from the next batch"""
+        if self._collector is None or self._collector.done():
+            self._collector = asyncio.create_task(self._collect())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future, time.perf_counter()))
+        return await future
+
+    async def embed_many(self, texts: list) -> list:
+        """Already-batched callers skip the queue but still use the model thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.encode_batch, texts)
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch    = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            now = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                self.queue_wait.observe((now - enqueued_at) * 1000)
+            self.batch_sizes.observe(len(batch))
+
+            # Identical texts in one window share a single slot in the batch
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                vectors = await loop.run_in_executor(self._executor, self.encode_batch, texts)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            by_text = dict(zip(texts, vectors))
+            for text, future, _ in batch:
+                if not future.done():
+                    future.set_result(by_text[text])
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms":    self.max_wait * 1000,
+            "queue_depth":    self._queue.qsize(),
+            "batch_size":     self.batch_sizes.snapshot(),
+            "queue_wait_ms":  self.queue_wait.snapshot(),
+        }
@@ -1,12 +1,8 @@
-import os
 import uuid
 from datetime import datetime, timedelta
-from supabase import create_client
-
-supabase = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_KEY")
-)
+from app.utils.db import get_supabase
+from app.memory.episodic_index import index_episodic_memories, remove_from_episodic_index
+from app.memory.versions import bump_memory_version
 
 async def save_episodic_memory(
     user_id: str,
@@ -15,18 +11,27 @@ async def save_episodic_memory(
     importance_score: float = 0.5
 ):
     """Save a conversation summary to episodic memory"""
+    supabase = await get_supabase()
     data = {
         "user_id": user_id,
         "session_id": session_id,
         "summary": summary,
         "importance_score": importance_score
     }
-    result = supabase.table("episodic_memories").insert(data).execute()
+    result = await supabase.table("episodic_memories").insert(data).execute()
+
+    # Embed into the user's episodic index — a failure here must not lose the row
+    try:
+        await index_episodic_memories(user_id, result.data)
+    except Exception as e:
+        print(f"⚠️ Episodic index write failed for user {user_id}: {e}")
+    await bump_memory_version(user_id)
     return result.data
 
 async def get_recent_episodic_memories(user_id: str, limit: int = 5) -> list:
     """Get recent summaries for context injection"""
-    result = supabase.table("episodic_memories")\
+    supabase = await get_supabase()
+    result = await supabase.table("episodic_memories")\
         .select("*")\
         .eq("user_id", user_id)\
         .eq("is_archived", False)\
@@ -35,20 +40,58 @@ async def get_recent_episodic_memories(user_id: str, limit: int = 5) -> list:
         .execute()
     return result.data
 
-async def get_old_episodic_memories(user_id: str, days: int = 7) -> list:
-    """Get memories older than N days for promotion to long-term"""
+async def get_old_episodic_memories(user_id: str, days: int = 7, limit: int = None) -> list:
+    """Get memories older than N days for promotion to long-term — oldest first, at most `limit`"""
+    supabase = await get_supabase()
     cutoff = (datetime.now() - timedelta(days=days)).isoformat()
-    result = supabase.table("episodic_memories")\
+    query  = supabase.table("episodic_memories")\
         .select("*")\
         .eq("user_id", user_id)\
         .eq("is_archived", False)\
         .lt("created_at", cutoff)\
-        .execute()
+        .order("created_at")
+    if limit is not None:
+        query = query.limit(limit)
+    result = await query.execute()
     return result.data
 
-async def archive_episodic_memory(memory_id: str):
+async def get_users_with_old_episodic_memories(days: int = 7, page_size: int = 500) -> list:
+    """Distinct user ids with unarchived memories older than N days (sql/episodic_promotion.sql)"""
+    supabase = await get_supabase()
+    cutoff   = (datetime.now() - timedelta(days=days)).isoformat()
+    users, after = [], None
+    while True:
+        result = await supabase.rpc("users_with_old_episodic_memories", {
+            "cutoff":     cutoff,
+            "after_user": after,
+            "page_size":  page_size
+        }).execute()
+        page = result.data   # setof scalar — a plain list of ids
+        users.extend(page)
+        if len(page) < page_size:
+            return users
+        after = page[-1]
+
+async def archive_episodic_memory(memory_id: str, user_id: str = None):
     """Mark memory as archived after promoting to long-term"""
-    supabase.table("episodic_memories")\
+    supabase = await get_supabase()
+    await supabase.table("episodic_memories")\
         .update({"is_archived": True})\
         .eq("id", memory_id)\
-        .execute()
\ No newline at end of file
+        .execute()
+    if user_id:
+        await remove_from_episodic_index(user_id, [memory_id])
+        await bump_memory_version(user_id)
+
+async def archive_episodic_memories(user_id: str, memory_ids: list):
+    """Bulk archive_episodic_memory — one update for all ids"""
+    if not memory_ids:
+        return
+    supabase = await get_supabase()
+    await supabase.table("episodic_memories")\
+        .update({"is_archived": True})\
+        .eq("user_id", user_id)\
+        .in_("id", memory_ids)\
+        .execute()
+    await remove_from_episodic_index(user_id, memory_ids)
+    await bump_memory_version(user_id)
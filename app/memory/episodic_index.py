@@ -0,0 +1,140 @@
+import asyncio
+import math
+import os
+import time
+from datetime import datetime
+from app.memory.longterm import get_embeddings
+from app.memory.partitions import open_partition
+from app.utils.db import get_supabase
+
+# ── Vector index over episodic summaries ──────────────────────
+# Summaries are embedded when written and stored in the user's "episodic"
+# partition (see partitions.py). Retrieval ranks by a blend of similarity
+# to the query, recency and importance_score instead of simply taking the
+# newest rows.
+
+EPISODIC_WEIGHT_SIMILARITY = float(os.getenv("EPISODIC_WEIGHT_SIMILARITY", 0.6))
+EPISODIC_WEIGHT_RECENCY    = float(os.getenv("EPISODIC_WEIGHT_RECENCY", 0.25))
+EPISODIC_WEIGHT_IMPORTANCE = float(os.getenv("EPISODIC_WEIGHT_IMPORTANCE", 0.15))
+EPISODIC_RECENCY_HALF_LIFE = float(os.getenv("EPISODIC_RECENCY_HALF_LIFE_DAYS", 7))
+EPISODIC_CANDIDATE_FACTOR  = 4   # vector candidates fetched per result before re-ranking
+
+EPISODIC_NAMESPACE = "episodic"
+
+def _to_epoch(created_at) -> float:
+    if not created_at:
+        return time.time()
+    return datetime.fromisoformat(str(created_at).replace("Z", "+00:00")).timestamp()
+
+async def index_episodic_memories(user_id: str, rows: list):
+    """Embed summaries in one batch and upsert them into the user's index"""
+    rows = [r for r in rows if r.get("summary")]
+    if not rows:
+        return
+    embeddings = await get_embeddings([r["summary"] for r in rows])
+    collection = await open_partition(EPISODIC_NAMESPACE, user_id, create=True)
+    await asyncio.to_thread(
+        collection.upsert,
+        ids=[str(r["id"]) for r in rows],
+        embeddings=embeddings,
+        documents=[r["summary"] for r in rows],
+        metadatas=[{
+            "session_id":       r.get("session_id") or "",
+            "created_at":       r.get("created_at") or "",
+            "created_ts":       _to_epoch(r.get("created_at")),
+            "importance_score": float(r.get("importance_score") or 0.5),
+        } for r in rows]
+    )
+
+async def remove_from_episodic_index(user_id: str, memory_ids: list):
+    """Drop archived summaries so they stop competing for context"""
+    if not memory_ids:
+        return
+    collection = await open_partition(EPISODIC_NAMESPACE, user_id)
+    if collection is None:
+        return
+    await asyncio.to_thread(collection.delete, ids=[str(i) for i in memory_ids])
+
+def _blended_score(similarity: float, created_ts: float, importance: float) -> float:
+    age_days = max(0.0, (time.time() - created_ts) / 86400)
+    recency  = math.pow(0.5, age_days / EPISODIC_RECENCY_HALF_LIFE)
+    return (EPISODIC_WEIGHT_SIMILARITY * similarity
+            + EPISODIC_WEIGHT_RECENCY * recency
+            + EPISODIC_WEIGHT_IMPORTANCE * importance)
+
+async def search_episodic_memories(user_id: str, query_embedding: list, top_k: int = 3) -> list:
+    """Top-k summaries by similarity + recency + importance, best first"""
+    collection = await open_partition(EPISODIC_NAMESPACE, user_id)
+    if collection is None:
+        return []
+    count = await asyncio.to_thread(collection.count)
+    if count == 0:
+        return []
+
+    results = await asyncio.to_thread(
+        collection.query,
+        query_embeddings=[query_embedding],
+        n_results=min(count, top_k * EPISODIC_CANDIDATE_FACTOR)
+    )
+
+    ranked = []
+    for memory_id, summary, meta, distance in zip(
+        results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]
+    ):
+        score = _blended_score(1 - distance, meta["created_ts"], meta["importance_score"])
+        ranked.append({
+            "id":               memory_id,
+            "summary":          summary,
+            "session_id":       meta.get("session_id"),
+            "created_at":       meta.get("created_at"),
+            "importance_score": meta["importance_score"],
+            "score":            round(score, 4),
+        })
+
+    ranked.sort(key=lambda m: m["score"], reverse=True)
+    return ranked[:top_k]
+
+async def index_missing_episodic_memories(user_id: str, rows: list) -> int:
+    """Index the rows that aren't in the user's index yet — returns how many"""
+    collection = await open_partition(EPISODIC_NAMESPACE, user_id)
+    if collection is not None and rows:
+        present = await asyncio.to_thread(collection.get, ids=[str(r["id"]) for r in rows], include=[])
+        present = set(present["ids"])
+        rows    = [r for r in rows if str(r["id"]) not in present]
+    await index_episodic_memories(user_id, rows)
+    return len(rows)
+
+async def repair_episodic_index(user_id: str) -> int:
+    """Re-index a user's live rows whose index write failed — returns how many"""
+    supabase = await get_supabase()
+    result = await supabase.table("episodic_memories")\
+        .select("id,user_id,session_id,summary,importance_score,created_at")\
+        .eq("user_id", user_id)\
+        .eq("is_archived", False)\
+        .execute()
+    return await index_missing_episodic_memories(user_id, result.data)
+
+async def backfill_episodic_index(batch_size: int = 200) -> int:
+    """Index every non-archived episodic row missing from the index — keyset-paginated and idempotent"""
+    supabase = await get_supabase()
+    indexed, scanned, last_id = 0, 0, None
+    while True:
+        query = supabase.table("episodic_memories")\
+            .select("id,user_id,session_id,summary,importance_score,created_at")\
+            .eq("is_archived", False)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        result = await query.order("id").limit(batch_size).execute()
+        rows = result.data
+        if not rows:
+            return indexed
+
+        by_user = {}
+        for row in rows:
+            by_user.setdefault(row["user_id"], []).append(row)
+        for user_id, user_rows in by_user.items():
+            indexed += await index_missing_episodic_memories(user_id, user_rows)
+
+        scanned += len(rows)
+        last_id  = rows[-1]["id"]
+        print(f"… scanned {scanned} episodic memories, indexed {indexed}")
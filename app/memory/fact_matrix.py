@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+# ── Exact in-memory search for small fact sets ────────────────
+# Most users have a few hundred facts at most. For them one matrix-vector
+# product over their L2-normalised embeddings is exact and far cheaper than
+# an HNSW query through Chroma's filter and serialisation layers. Each user's
+# matrix is hydrated from their partition on first search and dropped when
+# their facts change; partitions above LONGTERM_BRUTE_FORCE_MAX facts go to
+# Chroma. Other workers' writes are picked up after LONGTERM_MATRIX_TTL.
+
+LONGTERM_BRUTE_FORCE_MAX   = int(os.getenv("LONGTERM_BRUTE_FORCE_MAX", 1000))
+LONGTERM_MATRIX_MAX_USERS  = int(os.getenv("LONGTERM_MATRIX_MAX_USERS", 2048))
+LONGTERM_MATRIX_TTL        = float(os.getenv("LONGTERM_MATRIX_TTL", 60))
+
+def normalize_rows(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms  = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+def top_k_cosine(matrix: np.ndarray, query: np.ndarray, top_k: int) -> list:
+    """(row index, similarity) for the best `top_k` rows of a normalised matrix"""
+    scores = matrix @ query
+    if top_k < len(scores):
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        best = np.arange(len(scores))
+    best = best[np.argsort(-scores[best])]
+    return [(int(i), float(scores[i])) for i in best]
+
+class FactMatrixCache:
+    def __init__(self, max_size: int = LONGTERM_BRUTE_FORCE_MAX, max_users: int = LONGTERM_MATRIX_MAX_USERS, ttl: float = LONGTERM_MATRIX_TTL):
+        self.max_size  = max_size
+        self.max_users = max_users
+        self.ttl       = ttl
+        self._users    = OrderedDict()   # user_id -> entry, LRU by user
+        self._versions = {}              # user_id -> bumped on every invalidate
+        self._lock     = threading.Lock()
+
+        self.hits       = 0
+        self.hydrations = 0
+        self.fallbacks  = 0   # partition too large — served by Chroma
+
+    def invalidate(self, user_id: str):
+        """Drop a user's matrix — call after any upsert or delete"""
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def _entry(self, user_id: str, collection) -> dict:
+        with self._lock:
+            entry = self._users.get(user_id)
+            # A different collection id means the partition was dropped and recreated
+            if entry and entry["collection_id"] == collection.id and time.time() - entry["loaded_at"] < self.ttl:
+                self._users.move_to_end(user_id)
+                self.hits += 1
+                return entry
+            version = self._versions.get(user_id, 0)
+
+        count = collection.count()
+        if count > self.max_size:
+            entry = {"matrix": None, "documents": [], "too_large": True}
+        else:
+            data  = collection.get(include=["embeddings", "documents"])
+            entry = {
+                "matrix":    normalize_rows(data["embeddings"]) if data["ids"] else None,
+                "documents": data["documents"],
+                "too_large": False,
+            }
+        entry.update(collection_id=collection.id, loaded_at=time.time())
+        self.hydrations += 1
+
+        with self._lock:
+            # A write landed while we were reading — serve this result, don't keep it
+            if self._versions.get(user_id, 0) == version:
+                self._users[user_id] = entry
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+        return entry
+
+    def search(self, user_id: str, collection, query_embedding, top_k: int) -> list:
+        """(document, similarity) pairs best first — None if the partition is too large. Blocking."""
+        entry = self._entry(user_id, collection)
+        if entry["too_large"]:
+            self.fallbacks += 1
+            return None
+        if entry["matrix"] is None:
+            return []
+
+        query = normalize_rows(query_embedding)
+        return [(entry["documents"][i], score) for i, score in top_k_cosine(entry["matrix"], query, top_k)]
+
+    def stats(self) -> dict:
+        return {
+            "users":      len(self._users),
+            "hits":       self.hits,
+            "hydrations": self.hydrations,
+            "fallbacks":  self.fallbacks,
+            "max_size":   self.max_size,
+        }
+
+fact_matrix_cache = FactMatrixCache()
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+import numpy as np
+from app.memory.episodic import get_recent_episodic_memories
+from app.memory.episodic_index import EPISODIC_NAMESPACE
+from app.memory.longterm import search_longterm_memory, get_embeddings, fact_id, LONGTERM_NAMESPACE
+from app.memory.fact_matrix import normalize_rows
+from app.memory.partitions import open_partition
+from app.memory.versions import get_memory_version
+
+# ── Memory graph ──────────────────────────────────────────────
+# Fact ↔ summary cross-links come from one similarity matrix over their
+# embeddings instead of word-set overlap per pair. The vectors are read back
+# from the user's Chroma partitions; only rows missing there (legacy facts,
+# unindexed summaries) are embedded. Built graphs are cached per user and
+# reused until that user's memory version changes or GRAPH_CACHE_TTL passes —
+# a version bump is best-effort, so the TTL bounds how stale a graph can get.
+
+GRAPH_LINK_THRESHOLD      = float(os.getenv("GRAPH_LINK_THRESHOLD", 0.45))
+GRAPH_MAX_LINKS_PER_FACT  = int(os.getenv("GRAPH_MAX_LINKS_PER_FACT", 3))
+GRAPH_CACHE_MAX_USERS     = int(os.getenv("GRAPH_CACHE_MAX_USERS", 1000))
+GRAPH_CACHE_TTL           = float(os.getenv("GRAPH_CACHE_TTL", 300))
+
+_graph_cache = OrderedDict()   # user_id -> (memory version, built at, graph)
+
+async def _stored_vectors(namespace: str, user_id: str, ids: list, texts: list) -> list:
+    """Embeddings already stored in the user's partition — only rows missing there are encoded"""
+    stored     = {}
+    collection = await open_partition(namespace, user_id)
+    if collection is not None and ids:
+        data   = await asyncio.to_thread(collection.get, ids=ids, include=["embeddings"])
+        stored = dict(zip(data["ids"], data["embeddings"]))
+
+    missing = [i for i, row_id in enumerate(ids) if row_id not in stored]
+    encoded = dict(zip(missing, await get_embeddings([texts[i] for i in missing])))
+    return [stored[row_id] if row_id in stored else encoded[i] for i, row_id in enumerate(ids)]
+
+def cross_links(fact_vectors, summary_vectors) -> list:
+    """(fact index, summary index, similarity) for every pair above the threshold"""
+    if not len(fact_vectors) or not len(summary_vectors):
+        return []
+    sims = normalize_rows(fact_vectors) @ normalize_rows(summary_vectors).T
+    # Keep each fact's strongest links only — a dense hairball helps nobody
+    if sims.shape[1] > GRAPH_MAX_LINKS_PER_FACT:
+        cutoff = -np.partition(-sims, GRAPH_MAX_LINKS_PER_FACT - 1, axis=1)[:, GRAPH_MAX_LINKS_PER_FACT - 1:GRAPH_MAX_LINKS_PER_FACT]
+        sims   = np.where(sims >= cutoff, sims, -1.0)
+    facts, summaries = np.nonzero(sims >= GRAPH_LINK_THRESHOLD)
+    return [(int(i), int(j), float(sims[i, j])) for i, j in zip(facts, summaries)]
+
+async def build_memory_graph(user_id: str) -> dict:
+    """Build node graph data from all memory layers"""
+    episodic, longterm = await asyncio.gather(
+        get_recent_episodic_memories(user_id, limit=15),
+        search_longterm_memory(user_id, "user facts skills projects", top_k=15)
+    )
+    summaries = [mem.get("summary") or "" for mem in episodic]
+    facts     = [str(fact) for fact in longterm]
+    fact_vectors, summary_vectors = await asyncio.gather(
+        _stored_vectors(LONGTERM_NAMESPACE, user_id, [fact_id(f) for f in facts], facts),
+        _stored_vectors(EPISODIC_NAMESPACE, user_id, [str(mem["id"]) for mem in episodic], summaries)
+    )
+
+    nodes = []
+    links = []
+
+    # Central user node
+    nodes.append({
+        "id": "user",
+        "label": "You",
+        "type": "user",
+        "size": 28
+    })
+
+    # Layer hub nodes
+    nodes.append({"id": "hub_episodic", "label": "Episodic\nMemory",  "type": "hub_episodic",  "size": 20})
+    nodes.append({"id": "hub_longterm", "label": "Long-Term\nMemory", "type": "hub_longterm", "size": 20})
+
+    # Connect hubs to user
+    links.append({"source": "user", "target": "hub_episodic",  "strength": 0.8})
+    links.append({"source": "user", "target": "hub_longterm", "strength": 0.8})
+
+    # Episodic memory nodes
+    for i, mem in enumerate(episodic):
+        node_id = f"episodic_{i}"
+        # Truncate summary for label
+        label = (mem.get("summary") or "")[:40] + "..."
+        nodes.append({
+            "id":         node_id,
+            "label":      label,
+            "type":       "episodic",
+            "size":       12 + (mem.get("importance_score", 0.5) * 10),
+            "full_text":  mem.get("summary", ""),
+            "date":       mem.get("created_at", "")[:10]
+        })
+        links.append({"source": "hub_episodic", "target": node_id, "strength": 0.5})
+
+    # Long-term memory nodes
+    for i, fact in enumerate(facts):
+        node_id = f"longterm_{i}"
+        label   = fact[:35] + "..." if len(fact) > 35 else fact
+        nodes.append({
+            "id":        node_id,
+            "label":     label,
+            "type":      "longterm",
+            "size":      14,
+            "full_text": fact
+        })
+        links.append({"source": "hub_longterm", "target": node_id, "strength": 0.5})
+
+    # Cross-link: connect long-term facts to semantically related episodic nodes
+    for i, j, similarity in cross_links(fact_vectors, summary_vectors):
+        links.append({
+            "source":     f"longterm_{i}",
+            "target":     f"episodic_{j}",
+            "strength":   0.2,
+            "similarity": round(similarity, 3)
+        })
+
+    return {"nodes": nodes, "links": links}
+
+async def get_memory_graph(user_id: str) -> dict:
+    """Cached build_memory_graph — rebuilt only after the user's memory changes"""
+    version = await get_memory_version(user_id)
+    cached  = _graph_cache.get(user_id)
+    if cached and cached[0] == version and time.time() - cached[1] < GRAPH_CACHE_TTL:
+        _graph_cache.move_to_end(user_id)
+        return cached[2]
+
+    # Read the version first: a write landing mid-build bumps it past what we store
+    graph = await build_memory_graph(user_id)
+    _graph_cache[user_id] = (version, time.time(), graph)
+    _graph_cache.move_to_end(user_id)
+    while len(_graph_cache) > GRAPH_CACHE_MAX_USERS:
+        _graph_cache.popitem(last=False)
+    return graph
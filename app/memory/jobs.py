@@ -0,0 +1,213 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# ── Durable local job queue ───────────────────────────────────
+# Jobs live in a SQLite file so they survive restarts. A job that is
+# "running" holds a lease (run_after), renewed while its handler runs — if
+# the process dies mid-job the lease expires and another worker picks it up.
+
+JOBS_DB_PATH          = os.getenv("JOBS_DB_PATH", "./jobs_data/jobs.db")
+JOB_WORKERS           = int(os.getenv("JOB_WORKERS", 2))
+JOB_MAX_ATTEMPTS      = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_BASE_DELAY  = float(os.getenv("JOB_RETRY_BASE_DELAY", 5))
+JOB_LEASE_SECONDS     = float(os.getenv("JOB_LEASE_SECONDS", 300))
+JOB_POLL_INTERVAL     = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+JOB_DEFER_DELAY       = float(os.getenv("JOB_DEFER_DELAY", 30))
+JOB_ERROR_MAX_BACKOFF = float(os.getenv("JOB_ERROR_MAX_BACKOFF", 60))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind        TEXT    NOT NULL,
+    payload     TEXT    NOT NULL,
+    dedup_key   TEXT,
+    status      TEXT    NOT NULL DEFAULT 'pending',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    run_after   REAL    NOT NULL,
+    last_error  TEXT,
+    created_at  REAL    NOT NULL
+);
+-- At most one *pending* job per dedup key; a running job doesn't block a new one
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_pending_dedup ON jobs(dedup_key) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs(status, run_after);
+"""
+
+class JobDeferred(Exception):
+    """Raised by a handler that can't run yet — the job is retried later without using an attempt"""
+    def __init__(self, reason: str, delay: float = JOB_DEFER_DELAY):
+        super().__init__(reason)
+        self.delay = delay
+
+_handlers = {}
+_conn = None
+_conn_lock = threading.Lock()
+_wakeup = asyncio.Event()
+_workers = []
+
+def register_job_handler(kind: str, handler):
+    """Register an async handler(payload: dict) for a job kind"""
+    _handlers[kind] = handler
+
+def _get_conn() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(JOBS_DB_PATH) or ".", exist_ok=True)
+        _conn = sqlite3.connect(JOBS_DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.executescript(_SCHEMA)
+    return _conn
+
+def _insert(kind: str, payload: dict, dedup_key: str) -> bool:
+    with _conn_lock:
+        cur = _get_conn().execute(
+            "INSERT OR IGNORE INTO jobs (kind, payload, dedup_key, run_after, created_at) VALUES (?, ?, ?, ?, ?)",
+            (kind, json.dumps(payload), dedup_key, time.time(), time.time())
+        )
+        return cur.rowcount == 1
+
+def _claim() -> dict:
+    now = time.time()
+    with _conn_lock:
+        conn = _get_conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Pending jobs that are due, or running jobs whose lease expired
+            row = conn.execute(
+                "SELECT id, kind, payload, attempts FROM jobs "
+                "WHERE status IN ('pending', 'running') AND run_after <= ? "
+                "ORDER BY run_after LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row and row[3] >= JOB_MAX_ATTEMPTS:
+                # Lease expired on its last attempt — the process died running it
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', last_error = 'lease expired' WHERE id = ?",
+                    (row[0],)
+                )
+                row = None
+            elif row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, run_after = ? WHERE id = ?",
+                    (now + JOB_LEASE_SECONDS, row[0])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    if not row:
+        return None
+    return {"id": row[0], "kind": row[1], "payload": json.loads(row[2]), "attempts": row[3] + 1}
+
+def _renew_lease(job_id: int):
+    with _conn_lock:
+        _get_conn().execute(
+            "UPDATE jobs SET run_after = ? WHERE id = ? AND status = 'running'",
+            (time.time() + JOB_LEASE_SECONDS, job_id)
+        )
+
+async def _keep_lease(job_id: int):
+    """Extend a running job's lease so a long handler isn't picked up twice"""
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            await asyncio.to_thread(_renew_lease, job_id)
+        except Exception as e:
+            print(f"⚠️ Renewing lease of job #{job_id} failed: {e}")
+
+def _complete(job_id: int):
+    with _conn_lock:
+        _get_conn().execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+def _fail(job_id: int, attempts: int, error: str):
+    with _conn_lock:
+        conn = _get_conn()
+        if attempts >= JOB_MAX_ATTEMPTS:
+            conn.execute("UPDATE jobs SET status = 'failed', last_error = ? WHERE id = ?", (error, job_id))
+            return
+        delay = JOB_RETRY_BASE_DELAY * (2 ** (attempts - 1))
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', run_after = ?, last_error = ? WHERE id = ?",
+                (time.time() + delay, error, job_id)
+            )
+        except sqlite3.IntegrityError:
+            # A newer pending job with the same dedup key already covers this work
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+def _defer(job_id: int, delay: float, reason: str):
+    with _conn_lock:
+        conn = _get_conn()
+        try:
+            # Hand back the attempt _claim took — the handler never really ran
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = attempts - 1, run_after = ?, last_error = ? WHERE id = ?",
+                (time.time() + delay, reason, job_id)
+            )
+        except sqlite3.IntegrityError:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+async def enqueue_job(kind: str, payload: dict, dedup_key: str = None) -> bool:
+    """Queue a job — returns False if an identical job is already pending"""
+    inserted = await asyncio.to_thread(_insert, kind, payload, dedup_key)
+    if inserted:
+        _wakeup.set()
+    return inserted
+
+async def _run_job(job: dict):
+    handler = _handlers.get(job["kind"])
+    if handler is None:
+        await asyncio.to_thread(_fail, job["id"], JOB_MAX_ATTEMPTS, f"no handler for {job['kind']}")
+        return
+    lease = asyncio.create_task(_keep_lease(job["id"]))
+    try:
+        await handler(job["payload"])
+    except JobDeferred as e:
+        await asyncio.to_thread(_defer, job["id"], e.delay, str(e))
+    except Exception as e:
+        print(f"⚠️ Job {job['kind']}#{job['id']} failed (attempt {job['attempts']}): {e}")
+        await asyncio.to_thread(_fail, job["id"], job["attempts"], str(e))
+    else:
+        await asyncio.to_thread(_complete, job["id"])
+    finally:
+        lease.cancel()
+
+async def _worker_loop():
+    errors = 0
+    while True:
+        _wakeup.clear()
+        try:
+            job = await asyncio.to_thread(_claim)
+            if job is not None:
+                await _run_job(job)
+            errors = 0
+        except Exception as e:
+            # e.g. the SQLite file is locked or unwritable — back off, don't die
+            errors += 1
+            delay   = min(JOB_POLL_INTERVAL * 2 ** errors, JOB_ERROR_MAX_BACKOFF)
+            print(f"⚠️ Job worker error (retrying in {delay:.0f}s): {e}")
+            await asyncio.sleep(delay)
+            continue
+        if job is None:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+async def start_job_workers(count: int = JOB_WORKERS):
+    """Start the background worker pool — call once on app startup"""
+    await asyncio.to_thread(_get_conn)
+    for _ in range(count):
+        _workers.append(asyncio.create_task(_worker_loop()))
+    print(f"✅ Started {count} job workers ({JOBS_DB_PATH})")
+
+async def stop_job_workers():
+    """Cancel workers — interrupted jobs are retried once their lease expires"""
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
@@ -0,0 +1,55 @@
+import os
+import uuid
+from contextlib import asynccontextmanager
+from app.memory.working import redis
+
+# ── Redis locks ───────────────────────────────────────────────
+# Per-user lock so background maintenance and the chat-triggered lifecycle
+# never summarise or promote the same user's memory at the same time, and a
+# leader lock so only one uvicorn worker runs the periodic sweeps. Both are
+# SET NX EX with a random owner token; release / renewal check the token so
+# a worker never frees a lock that expired and was taken by someone else.
+
+USER_LOCK_TTL = int(os.getenv("USER_LOCK_TTL", 300))
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+_ACQUIRE_OR_RENEW_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if owner == ARGV[1] then redis.call('EXPIRE', KEYS[1], ARGV[2]) return 1 end
+if not owner then redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2]) return 1 end
+return 0
+"""
+
+def get_user_lock_key(user_id: str) -> str:
+    return f"lock:memory:{user_id}"
+
+async def acquire_user_lock(user_id: str, ttl: int = USER_LOCK_TTL) -> str:
+    """Owner token if the lock was free, else None"""
+    token = uuid.uuid4().hex
+    if await redis.set(get_user_lock_key(user_id), token, nx=True, ex=ttl):
+        return token
+    return None
+
+async def release_user_lock(user_id: str, token: str):
+    await redis.eval(_RELEASE_SCRIPT, keys=[get_user_lock_key(user_id)], args=[token])
+
+@asynccontextmanager
+async def user_lock(user_id: str, ttl: int = USER_LOCK_TTL):
+    """`async with user_lock(uid) as locked:` — locked is False if someone else holds it"""
+    token = await acquire_user_lock(user_id, ttl)
+    try:
+        yield token is not None
+    finally:
+        if token:
+            await release_user_lock(user_id, token)
+
+async def acquire_or_renew_leadership(name: str, owner: str, ttl: int) -> bool:
+    """Become (or stay) leader for `name` — True if `owner` holds it for another ttl seconds"""
+    return bool(await redis.eval(_ACQUIRE_OR_RENEW_SCRIPT, keys=[f"leader:{name}"], args=[owner, str(ttl)]))
+
+async def release_leadership(name: str, owner: str):
+    await redis.eval(_RELEASE_SCRIPT, keys=[f"leader:{name}"], args=[owner])
@@ -1,53 +1,320 @@
 import os
-import chromadb
-from sentence_transformers import SentenceTransformer
+import asyncio
+import hashlib
+import time
+import numpy as np
+from chromadb.errors import InvalidCollectionException
+from app.memory.partitions import chroma_client, get_partition, open_partition, drop_partition, list_partition_names
+from app.memory.embedder import EMBEDDING_BACKEND, load_embedder, embedder_cache_name
+from app.memory.embedding_cache import EmbeddingCache
+from app.memory.embedding_service import EmbeddingBatcher
+from app.memory.fact_matrix import fact_matrix_cache, normalize_rows
+from app.memory.versions import bump_memory_version
 
-# Initialize ChromaDB (local, free)
-chroma_client = chromadb.PersistentClient(path="./chromadb_data")
-collection = chroma_client.get_or_create_collection(
-    name="user_longterm_memory",
-    metadata={"hnsw:space": "cosine"}
-)
+# Facts live in one Chroma collection per user (see partitions.py)
+LONGTERM_NAMESPACE = "longterm"
+# Pre-partitioning store shared by all users — read as a fallback until
+# scripts.migrate_longterm_partitions has split it
+LEGACY_COLLECTION  = "user_longterm_memory"
+# Facts at least this similar are the same fact — merged on ingest and by compaction
+LONGTERM_DEDUP_THRESHOLD = float(os.getenv("LONGTERM_DEDUP_THRESHOLD", 0.95))
 
-# Free embeddings model
-embedder = SentenceTransformer('all-MiniLM-L6-v2')
+# Free embeddings model (backend picked by EMBEDDING_BACKEND)
+embedder        = load_embedder(EMBEDDING_BACKEND)
+embedding_cache = EmbeddingCache(embedder_cache_name(EMBEDDING_BACKEND))
 
-def get_embedding(text: str) -> list:
-    return embedder.encode(text).tolist()
+def _embed_batch_uncached(texts: list) -> list:
+    """Cache lookups, then ONE forward pass for every miss — runs on the model thread"""
+    vectors = [embedding_cache.get(text) for text in texts]
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        encoded = embedder.encode([texts[i] for i in missing])
+        for i, vector in zip(missing, encoded):
+            embedding_cache.put(texts[i], vector)
+            vectors[i] = vector
+    return vectors
 
-async def save_longterm_memory(user_id: str, facts: dict):
-    """Save extracted user facts to vector DB"""
+# Concurrent single-text requests are coalesced into one encode call
+embedding_batcher = EmbeddingBatcher(_embed_batch_uncached)
+
+async def get_embedding(text: str) -> list:
+    """Embed text — cached by content, misses are micro-batched across requests"""
+    vector = embedding_cache.get_memory(text)
+    if vector is None:
+        vector = await embedding_batcher.embed(text)
+    return vector.tolist()
+
+async def get_embeddings(texts: list) -> list:
+    """Batched get_embedding — one encode call for all uncached texts"""
+    if not texts:
+        return []
+    vectors = await embedding_batcher.embed_many(texts)
+    return [v.tolist() for v in vectors]
+
+def facts_to_documents(facts: dict) -> list:
+    """Flatten extracted facts into (fact_type, text) pairs — one per list item"""
+    documents = []
     for key, value in facts.items():
         if not value:
             continue
-        
-        fact_text = f"{key}: {value}"
-        embedding = get_embedding(fact_text)
-        doc_id = f"{user_id}_{key}_{hash(str(value))}"
-        
+        items = value if isinstance(value, list) else [value]
+        for item in items:
+            if item:
+                documents.append((key, f"{key}: {item}"))
+    return documents
+
+def fact_id(fact_text: str) -> str:
+    """Content-hash id — the same fact gets the same id in every process"""
+    normalized = " ".join(fact_text.lower().split())
+    return "fact_" + hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+def _ingest_facts(collection, user_id: str, fact_types: list, texts: list, embeddings: list) -> dict:
+    """Upsert new facts, folding near-duplicates into what's stored. Blocking."""
+    now     = time.time()
+    vectors = normalize_rows(embeddings)
+
+    # Near-duplicates within the batch — first one wins
+    keep = []
+    for i in range(len(texts)):
+        if not keep or (vectors[keep] @ vectors[i]).max() < LONGTERM_DEDUP_THRESHOLD:
+            keep.append(i)
+    merged = len(texts) - len(keep)
+
+    # Near-duplicates of stored facts — reinforce the stored one instead
+    reinforced = {}
+    if collection.count() > 0:
+        nearest = collection.query(
+            query_embeddings=[embeddings[i] for i in keep],
+            n_results=1,
+            include=["distances", "metadatas"]
+        )
+        fresh = []
+        for i, ids, distances, metas in zip(keep, nearest["ids"], nearest["distances"], nearest["metadatas"]):
+            if ids and 1 - distances[0] >= LONGTERM_DEDUP_THRESHOLD:
+                meta = reinforced.get(ids[0], metas[0])
+                reinforced[ids[0]] = {**meta, "mentions": meta.get("mentions", 1) + 1, "last_seen": now}
+            else:
+                fresh.append(i)
+        merged += len(keep) - len(fresh)
+        keep = fresh
+
+    if keep:
         collection.upsert(
-            ids=[doc_id],
-            embeddings=[embedding],
-            documents=[fact_text],
-            metadatas=[{"user_id": user_id, "fact_type": key}]
+            ids=[fact_id(texts[i]) for i in keep],
+            embeddings=[embeddings[i] for i in keep],
+            documents=[texts[i] for i in keep],
+            metadatas=[{
+                "user_id":    user_id,
+                "fact_type":  fact_types[i],
+                "mentions":   1,
+                "first_seen": now,
+                "last_seen":  now,
+            } for i in keep]
         )
+    if reinforced:
+        collection.update(ids=list(reinforced), metadatas=list(reinforced.values()))
+    return {"added": len(keep), "merged": merged}
+
+async def save_longterm_memory(user_id: str, facts: dict) -> dict:
+    """Save extracted user facts to vector DB — batched encode, near-duplicates merged"""
+    documents = facts_to_documents(facts)
+    if not documents:
+        return {"added": 0, "merged": 0}
 
-async def search_longterm_memory(user_id: str, query: str, top_k: int = 3) -> list:
-    """Semantic search for relevant user facts"""
-    query_embedding = get_embedding(query)
+    # Same fact twice in one batch would be a duplicate id for Chroma
+    unique = {}
+    for key, fact_text in documents:
+        unique.setdefault(fact_id(fact_text), (key, fact_text))
+
+    fact_types = [key for key, _ in unique.values()]
+    texts      = [text for _, text in unique.values()]
+    embeddings = await get_embeddings(texts)
+
+    collection = await open_partition(LONGTERM_NAMESPACE, user_id, create=True)
+    result     = await asyncio.to_thread(_ingest_facts, collection, user_id, fact_types, texts, embeddings)
+    fact_matrix_cache.invalidate(user_id)
+    await bump_memory_version(user_id)
+    return result
+
+async def search_longterm_memory_scored(user_id: str, query: str, top_k: int = 3, query_embedding: list = None) -> list:
+    """Semantic search returning (fact, cosine similarity) pairs, best first"""
+    if query_embedding is None:
+        query_embedding = await get_embedding(query)
     
-    results = collection.query(
+    collection, legacy = await asyncio.gather(
+        open_partition(LONGTERM_NAMESPACE, user_id),
+        asyncio.to_thread(_get_legacy_collection)
+    )
+
+    scored = []
+    if collection is not None:
+        # Small partitions: exact NumPy top-k, no HNSW round trip
+        scored = await asyncio.to_thread(fact_matrix_cache.search, user_id, collection, query_embedding, top_k)
+        if scored is None:
+            results = await asyncio.to_thread(
+                collection.query,
+                query_embeddings=[query_embedding],
+                n_results=top_k
+            )
+            scored = _scored_results(results)
+
+    if legacy is None:
+        return scored
+
+    # Until the shared collection is migrated away, a user's older facts may
+    # still live there even though their partition exists — merge both
+    results = await asyncio.to_thread(
+        legacy.query,
         query_embeddings=[query_embedding],
         n_results=top_k,
         where={"user_id": user_id}
     )
-    
+    merged = {}
+    for doc, similarity in scored + _scored_results(results):
+        merged[doc] = max(similarity, merged.get(doc, similarity))
+    return sorted(merged.items(), key=lambda pair: pair[1], reverse=True)[:top_k]
+
+def _scored_results(results: dict) -> list:
     if results and results["documents"]:
-        return results["documents"][0]
+        # Collection uses cosine space — distance = 1 - similarity
+        return [(doc, 1 - dist) for doc, dist in zip(results["documents"][0], results["distances"][0])]
     return []
 
+async def search_longterm_memory(user_id: str, query: str, top_k: int = 3, query_embedding: list = None) -> list:
+    """Semantic search for relevant user facts — pass `query_embedding` if already computed"""
+    scored = await search_longterm_memory_scored(user_id, query, top_k, query_embedding)
+    return [doc for doc, _ in scored]
+
 async def delete_user_memory(user_id: str):
     """Delete all memories for a user"""
-    results = collection.get(where={"user_id": user_id})
-    if results["ids"]:
-        collection.delete(ids=results["ids"])
\ No newline at end of file
+    await asyncio.to_thread(drop_partition, LONGTERM_NAMESPACE, user_id)
+    fact_matrix_cache.invalidate(user_id)
+    legacy = await asyncio.to_thread(_get_legacy_collection)
+    if legacy is not None:
+        await asyncio.to_thread(legacy.delete, where={"user_id": user_id})
+    await bump_memory_version(user_id)
+
+# ── Compaction ────────────────────────────────────────────────
+def compact_partition(collection) -> dict:
+    """Merge near-duplicate facts and move old ids to content hashes. Blocking.
+
+    Within each cluster of facts at least LONGTERM_DEDUP_THRESHOLD similar, the
+    most-mentioned (then most recent) fact survives and inherits the others'
+    mention counts. Survivors are written before duplicates are deleted, so
+    an interrupted run leaves duplicates behind, never gaps.
+    """
+    data = collection.get(include=["embeddings", "documents", "metadatas"])
+    ids  = data["ids"]
+    if not ids:
+        return {"before": 0, "after": 0, "merged": 0, "rekeyed": 0}
+
+    metas  = data["metadatas"]
+    matrix = normalize_rows(data["embeddings"])
+    order  = sorted(range(len(ids)), key=lambda i: (metas[i].get("mentions", 1), metas[i].get("last_seen", 0)), reverse=True)
+
+    alive     = np.ones(len(ids), dtype=bool)
+    survivors = []   # (index, duplicate indices)
+    for i in order:
+        if not alive[i]:
+            continue
+        alive[i]   = False
+        duplicates = np.flatnonzero(alive & (matrix @ matrix[i] >= LONGTERM_DEDUP_THRESHOLD))
+        alive[duplicates] = False
+        survivors.append((i, duplicates))
+
+    new_ids = [fact_id(data["documents"][i]) for i, _ in survivors]
+    changed = [
+        (new_id, i, duplicates) for new_id, (i, duplicates) in zip(new_ids, survivors)
+        if len(duplicates) or new_id != ids[i]
+    ]
+    if changed:
+        collection.upsert(
+            ids=[new_id for new_id, _, _ in changed],
+            embeddings=[data["embeddings"][i] for _, i, _ in changed],
+            documents=[data["documents"][i] for _, i, _ in changed],
+            metadatas=[{
+                **metas[i],
+                "mentions": sum(metas[j].get("mentions", 1) for j in [i, *duplicates]),
+            } for _, i, duplicates in changed]
+        )
+        stale = list(set(ids) - set(new_ids))
+        if stale:
+            collection.delete(ids=stale)
+
+    return {
+        "before":  len(ids),
+        "after":   len(survivors),
+        "merged":  len(ids) - len(survivors),
+        "rekeyed": sum(1 for new_id, (i, _) in zip(new_ids, survivors) if new_id != ids[i]),
+    }
+
+async def compact_longterm_memory(user_id: str) -> dict:
+    """Compact one user's long-term partition and report how much it shrank"""
+    collection = await open_partition(LONGTERM_NAMESPACE, user_id)
+    if collection is None:
+        return {"before": 0, "after": 0, "merged": 0, "rekeyed": 0}
+
+    result = await asyncio.to_thread(compact_partition, collection)
+    fact_matrix_cache.invalidate(user_id)
+    if result["merged"] or result["rekeyed"]:
+        await bump_memory_version(user_id)
+        print(f"🧹 Compacted long-term memory for user {user_id}: "
+              f"{result['before']} → {result['after']} facts ({result['rekeyed']} re-keyed)")
+    return result
+
+def list_longterm_users() -> list:
+    """User ids owning a long-term partition — read from each partition's metadata. Blocking."""
+    users = []
+    for name in list_partition_names(LONGTERM_NAMESPACE):
+        sample = chroma_client.get_collection(name=name).get(limit=1, include=["metadatas"])
+        if sample["metadatas"]:
+            users.append(sample["metadatas"][0]["user_id"])
+    return users
+
+# ── Legacy shared collection ──────────────────────────────────
+def _get_legacy_collection():
+    """The old all-users collection, or None once it has been migrated away"""
+    try:
+        return chroma_client.get_collection(name=LEGACY_COLLECTION)
+    except (InvalidCollectionException, ValueError):
+        return None
+
+def migrate_legacy_collection(batch_size: int = 500) -> dict:
+    """Split the shared collection into per-user partitions, then drop it. Blocking.
+
+    Stored embeddings are copied as-is, so nothing is re-encoded. Safe to
+    re-run — partitions are upserted by id and the legacy collection is only
+    deleted after every row has been copied.
+    """
+    legacy = _get_legacy_collection()
+    if legacy is None:
+        return {"rows": 0, "users": []}
+
+    rows, users, offset = 0, set(), 0
+    while True:
+        batch = legacy.get(
+            limit=batch_size,
+            offset=offset,
+            include=["embeddings", "documents", "metadatas"]
+        )
+        if not batch["ids"]:
+            break
+
+        by_user = {}
+        for i, meta in enumerate(batch["metadatas"]):
+            by_user.setdefault(meta["user_id"], []).append(i)
+        for user_id, idx in by_user.items():
+            get_partition(LONGTERM_NAMESPACE, user_id, create=True).upsert(
+                ids=[batch["ids"][i] for i in idx],
+                embeddings=[batch["embeddings"][i] for i in idx],
+                documents=[batch["documents"][i] for i in idx],
+                metadatas=[batch["metadatas"][i] for i in idx]
+            )
+            users.add(user_id)
+
+        rows   += len(batch["ids"])
+        offset += batch_size
+        print(f"… copied {rows} long-term facts")
+
+    chroma_client.delete_collection(name=LEGACY_COLLECTION)
+    return {"rows": rows, "users": sorted(users)}
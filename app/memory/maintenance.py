@@ -0,0 +1,146 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from app.memory.working import (
+    get_idle_sessions, get_session_last_active, deactivate_session, get_working_memory_length, WORKING_MEMORY_TTL
+)
+from app.memory.episodic import get_users_with_old_episodic_memories
+from app.memory.episodic_index import repair_episodic_index
+from app.memory.longterm import compact_longterm_memory, list_longterm_users
+from app.memory.scheduler import summarize_working_memory, promote_episodic_memories
+from app.memory.locks import user_lock, acquire_or_renew_leadership, release_leadership
+from app.utils.credentials import get_user_groq_key
+
+# ── Periodic memory maintenance ───────────────────────────────
+# Sweeps that don't wait for a chat message:
+#   promotion  users with episodic rows old enough to promote to long-term
+#   sessions   idle working-memory sessions, summarised before their TTL drops them
+#   compaction near-duplicate merge of every long-term partition
+# Every worker starts the scheduler but only the Redis-elected leader runs
+# the sweeps. Per-user work takes the user's memory lock (shared with the
+# chat-triggered lifecycle) and runs at most MAINTENANCE_CONCURRENCY at once.
+
+MAINTENANCE_ENABLED             = os.getenv("MAINTENANCE_ENABLED", "1") == "1"
+MAINTENANCE_CONCURRENCY         = int(os.getenv("MAINTENANCE_CONCURRENCY", 4))
+MAINTENANCE_LEADER_TTL          = int(os.getenv("MAINTENANCE_LEADER_TTL", 60))
+PROMOTION_SWEEP_INTERVAL        = int(os.getenv("PROMOTION_SWEEP_INTERVAL", 900))
+SESSION_SWEEP_INTERVAL          = int(os.getenv("SESSION_SWEEP_INTERVAL", 300))
+COMPACTION_SWEEP_INTERVAL       = int(os.getenv("COMPACTION_SWEEP_INTERVAL", 86400))
+# Summarise a session once it has been idle this long — must leave at least
+# one sweep interval before WORKING_MEMORY_TTL expires it
+SESSION_SUMMARIZE_IDLE_SECONDS  = int(os.getenv(
+    "SESSION_SUMMARIZE_IDLE_SECONDS", max(WORKING_MEMORY_TTL - 2 * SESSION_SWEEP_INTERVAL, 60)
+))
+SESSION_SUMMARIZE_MIN_MESSAGES  = int(os.getenv("SESSION_SUMMARIZE_MIN_MESSAGES", 2))
+
+_LEADER_NAME = "memory_maintenance"
+_worker_id   = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_scheduler   = None
+_semaphore   = None
+
+async def _is_leader() -> bool:
+    try:
+        return await acquire_or_renew_leadership(_LEADER_NAME, _worker_id, MAINTENANCE_LEADER_TTL)
+    except Exception as e:
+        print(f"⚠️ Maintenance leader check failed: {e}")
+        return False
+
+async def _for_each_user(user_ids: list, work) -> int:
+    """Run `work(user_id)` under the global semaphore and the user's lock — returns how many ran"""
+    async def _one(user_id: str):
+        async with _semaphore:
+            async with user_lock(user_id) as locked:
+                if not locked:
+                    return False   # a live chat's lifecycle has it — next sweep
+                try:
+                    await work(user_id)
+                except Exception as e:
+                    print(f"⚠️ Maintenance failed for user {user_id}: {e}")
+                    return False
+                return True
+
+    done = await asyncio.gather(*(_one(user_id) for user_id in user_ids))
+    return sum(done)
+
+# ── Sweeps ────────────────────────────────────────────────────
+async def promotion_sweep():
+    if not await _is_leader():
+        return
+
+    async def _promote(user_id: str):
+        groq_api_key = await get_user_groq_key(user_id)
+        if groq_api_key:
+            await promote_episodic_memories(user_id, groq_api_key)
+
+    users = await get_users_with_old_episodic_memories(days=7)
+    done  = await _for_each_user(users, _promote)
+    print(f"🧹 Promotion sweep: {done}/{len(users)} users")
+
+async def session_sweep():
+    if not await _is_leader():
+        return
+
+    sessions = {}
+    for user_id, session_id, _ in await get_idle_sessions(SESSION_SUMMARIZE_IDLE_SECONDS):
+        sessions.setdefault(user_id, []).append(session_id)
+
+    async def _summarize(user_id: str):
+        groq_api_key = await get_user_groq_key(user_id)
+        if not groq_api_key:
+            return
+        for session_id in sessions[user_id]:
+            # Re-check under the lock — the user may have come back since the range read
+            last_active = await get_session_last_active(user_id, session_id)
+            if last_active is None or time.time() - last_active < SESSION_SUMMARIZE_IDLE_SECONDS:
+                continue
+            if await get_working_memory_length(user_id, session_id) >= SESSION_SUMMARIZE_MIN_MESSAGES:
+                await summarize_working_memory(user_id, session_id, groq_api_key)
+            # Done with it until the next write puts it back in the index
+            await deactivate_session(user_id, session_id, last_active)
+        # Summaries whose index write failed would only surface via the
+        # newest-rows fallback — put them back while the user is recent
+        await repair_episodic_index(user_id)
+
+    done = await _for_each_user(list(sessions), _summarize)
+    print(f"🧹 Session sweep: {done}/{len(sessions)} users with idle sessions")
+
+async def compaction_sweep():
+    if not await _is_leader():
+        return
+    users = await asyncio.to_thread(list_longterm_users)
+    done  = await _for_each_user(users, compact_longterm_memory)
+    print(f"🧹 Compaction sweep: {done}/{len(users)} users")
+
+async def _heartbeat():
+    """Keep leadership between sweeps so it doesn't flap across workers"""
+    await _is_leader()
+
+# ── Lifecycle ─────────────────────────────────────────────────
+async def start_maintenance():
+    """Start the periodic sweeps — call once on app startup"""
+    global _scheduler, _semaphore
+    if not MAINTENANCE_ENABLED:
+        return
+    _semaphore = asyncio.Semaphore(MAINTENANCE_CONCURRENCY)
+    _scheduler = AsyncIOScheduler()
+    options    = {"max_instances": 1, "coalesce": True, "misfire_grace_time": 60}
+    _scheduler.add_job(_heartbeat,        "interval", seconds=max(MAINTENANCE_LEADER_TTL // 3, 1), **options)
+    _scheduler.add_job(promotion_sweep,   "interval", seconds=PROMOTION_SWEEP_INTERVAL,  **options)
+    _scheduler.add_job(session_sweep,     "interval", seconds=SESSION_SWEEP_INTERVAL,    **options)
+    _scheduler.add_job(compaction_sweep,  "interval", seconds=COMPACTION_SWEEP_INTERVAL, **options)
+    _scheduler.start()
+    print(f"✅ Started memory maintenance ({_worker_id})")
+
+async def stop_maintenance():
+    global _scheduler
+    if _scheduler is None:
+        return
+    _scheduler.shutdown(wait=False)
+    _scheduler = None
+    try:
+        await release_leadership(_LEADER_NAME, _worker_id)
+    except Exception as e:
+        print(f"⚠️ Releasing maintenance leadership failed: {e}")
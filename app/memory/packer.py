@@ -0,0 +1,94 @@
+from app.utils.token_counter import count_tokens, count_tokens_cached, message_tokens
+
+# ── Token-budgeted context packing ────────────────────────────
+# Every candidate snippet from the three memory layers gets a score in
+# roughly [0, 1]; snippets are added greedily, best first, while they fit
+# in the complexity's context_budget (see MODEL_CONFIG).
+#   working   newest exchange = 1.0, then decays per message going back
+#   longterm  cosine similarity to the query
+#   episodic  blended index score, else half importance_score, half recency rank
+# A rolling session summary stands in for the folded-out start of the
+# conversation, so it is always kept and reserved up front.
+
+WORKING_KEEP_RECENT    = 2      # newest messages always score 1.0
+WORKING_RECENCY_DECAY  = 0.85
+EPISODIC_RECENCY_DECAY = 0.7
+MESSAGE_OVERHEAD       = 4      # per chat message, as in count_messages_tokens
+BULLET_OVERHEAD        = 2      # "- " + newline per fact / summary
+PROMPT_RESERVE         = 40     # system line + section headers
+
+def _working_score(age: int) -> float:
+    if age < WORKING_KEEP_RECENT:
+        return 1.0
+    return WORKING_RECENCY_DECAY ** (age - WORKING_KEEP_RECENT + 1)
+
+def pack_context(
+    working: list,
+    episodic: list,
+    longterm_scored: list,
+    user_message: str,
+    budget: int,
+    session_summary: str = None,
+    session_summary_tokens: int = None
+) -> dict:
+    """Pick which memory snippets go into the prompt.
+
+    Returns the kept snippets per layer (in prompt order) plus a `report`
+    of what was kept and dropped, for `memory_used`.
+    """
+    # The user message is one-off text — counted plainly, not cached, and
+    # handed back so the caller stores this count with the message
+    user_message_tokens = count_tokens(user_message)
+    user_tokens         = user_message_tokens + MESSAGE_OVERHEAD
+    summary_tokens      = 0
+    if session_summary:
+        summary_tokens = session_summary_tokens if session_summary_tokens is not None else count_tokens_cached(session_summary)
+    remaining           = budget - user_tokens - summary_tokens - PROMPT_RESERVE
+
+    candidates = []   # (score, layer, index, tokens)
+    for i, message in enumerate(working):
+        age = len(working) - 1 - i
+        candidates.append((_working_score(age), "working", i,
+                           message_tokens(message) + MESSAGE_OVERHEAD))
+    for i, (fact, similarity) in enumerate(longterm_scored):
+        candidates.append((similarity, "longterm", i, count_tokens_cached(fact) + BULLET_OVERHEAD))
+    for i, memory in enumerate(episodic):
+        score = memory.get("score")   # blended rank from the episodic index
+        if score is None:
+            score = 0.5 * (memory.get("importance_score") or 0.5) + 0.5 * EPISODIC_RECENCY_DECAY ** i
+        candidates.append((score, "episodic", i, count_tokens_cached(memory.get("summary") or "") + BULLET_OVERHEAD))
+
+    # Best first; among equal scores prefer newer working messages
+    candidates.sort(key=lambda c: (-c[0], -c[2] if c[1] == "working" else c[2]))
+
+    kept          = {"working": set(), "episodic": set(), "longterm": set()}
+    working_floor = -1   # working memory must stay a contiguous, newest-first suffix
+    used          = 0
+    for score, layer, index, tokens in candidates:
+        if layer == "working" and index <= working_floor:
+            continue
+        if tokens <= remaining - used:
+            kept[layer].add(index)
+            used += tokens
+        elif layer == "working":
+            working_floor = index
+
+    if working_floor >= 0:
+        kept["working"] = {i for i in kept["working"] if i > working_floor}
+        used = sum(c[3] for c in candidates if c[2] in kept[c[1]])
+
+    return {
+        "working":  [m for i, m in enumerate(working) if i in kept["working"]],
+        "episodic": [m for i, m in enumerate(episodic) if i in kept["episodic"]],
+        "longterm": [f for i, (f, _) in enumerate(longterm_scored) if i in kept["longterm"]],
+        "user_message_tokens": user_message_tokens,
+        "report": {
+            "budget":      budget,
+            "used_tokens": used + user_tokens + summary_tokens + PROMPT_RESERVE,
+            "dropped": {
+                "working":  len(working) - len(kept["working"]),
+                "episodic": len(episodic) - len(kept["episodic"]),
+                "longterm": len(longterm_scored) - len(kept["longterm"]),
+            },
+        },
+    }
@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+import chromadb
+from chromadb.config import Settings
+from chromadb.errors import InvalidCollectionException
+from app.memory.versions import get_memory_version
+
+# ── Per-user vector partitions ────────────────────────────────
+# Every user gets their own Chroma collection per memory namespace
+# ("longterm", "episodic"), created on first write. A query only touches
+# that user's HNSW index, so latency follows the size of one user's data
+# instead of the whole deployment. Chroma's LRU segment cache unloads idle
+# partitions once CHROMA_MEMORY_LIMIT_BYTES is reached; collection handles
+# are kept in a small LRU here so hot users skip the sysdb lookup. A cached
+# handle is tagged with the user's memory version and only reused while it
+# is unchanged, so a partition dropped by another worker is looked up again.
+
+CHROMA_PATH                 = os.getenv("CHROMA_PATH", "./chromadb_data")
+CHROMA_MEMORY_LIMIT_BYTES   = int(os.getenv("CHROMA_MEMORY_LIMIT_BYTES", 512 * 1024 * 1024))
+PARTITION_HANDLE_CACHE_SIZE = int(os.getenv("PARTITION_HANDLE_CACHE_SIZE", 1024))
+
+chroma_client = chromadb.PersistentClient(
+    path=CHROMA_PATH,
+    settings=Settings(
+        chroma_segment_cache_policy="LRU",
+        chroma_memory_limit_bytes=CHROMA_MEMORY_LIMIT_BYTES
+    )
+)
+
+_handles      = OrderedDict()   # collection name -> (Collection, memory version)
+_handles_lock = threading.Lock()
+
+def partition_name(namespace: str, user_id: str) -> str:
+    """Collection name for a user's partition — ids Chroma can't take are hashed"""
+    if re.fullmatch(r"[a-zA-Z0-9][a-zA-Z0-9_-]{0,47}[a-zA-Z0-9]|[a-zA-Z0-9]", user_id):
+        return f"{namespace}_{user_id}"
+    return f"{namespace}_{hashlib.sha1(user_id.encode()).hexdigest()}"
+
+def get_partition(namespace: str, user_id: str, create: bool = False, version: int = None):
+    """A user's collection — None if it doesn't exist and `create` is False. Blocking.
+
+    With a `version`, a cached handle tagged with a different memory version
+    is discarded and looked up again.
+    """
+    name = partition_name(namespace, user_id)
+    with _handles_lock:
+        cached = _handles.get(name)
+        if cached and (version is None or cached[1] == version):
+            _handles.move_to_end(name)
+            return cached[0]
+
+    if create:
+        collection = chroma_client.get_or_create_collection(name=name, metadata={"hnsw:space": "cosine"})
+    else:
+        try:
+            collection = chroma_client.get_collection(name=name)
+        except (InvalidCollectionException, ValueError):
+            with _handles_lock:
+                _handles.pop(name, None)
+            return None   # user has never written to this namespace
+
+    with _handles_lock:
+        _handles[name] = (collection, version)
+        _handles.move_to_end(name)
+        while len(_handles) > PARTITION_HANDLE_CACHE_SIZE:
+            _handles.popitem(last=False)
+    return collection
+
+async def open_partition(namespace: str, user_id: str, create: bool = False):
+    """get_partition for async callers — revalidates cached handles against the memory version"""
+    try:
+        version = await get_memory_version(user_id)
+    except Exception as e:
+        print(f"⚠️ Memory version read failed for user {user_id}: {e}")
+        version = None   # Redis down — fall back to the cached handle
+    return await asyncio.to_thread(get_partition, namespace, user_id, create, version)
+
+def drop_partition(namespace: str, user_id: str):
+    """Delete a user's collection entirely. Blocking."""
+    name = partition_name(namespace, user_id)
+    with _handles_lock:
+        _handles.pop(name, None)
+    try:
+        chroma_client.delete_collection(name=name)
+    except (InvalidCollectionException, ValueError):
+        pass
+
+def list_partition_names(namespace: str) -> list:
+    """Collection names of every user partition in a namespace. Blocking."""
+    # chromadb 0.6 returns names; older clients returned Collection objects
+    names = [getattr(c, "name", c) for c in chroma_client.list_collections()]
+    return [name for name in names if name.startswith(f"{namespace}_")]
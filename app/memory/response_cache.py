@@ -0,0 +1,93 @@
+import os
+import time
+from collections import OrderedDict
+import numpy as np
+
+# ── Semantic response cache ───────────────────────────────────
+# Per-user store of (question embedding, answer). A new question whose
+# embedding is within RESPONSE_CACHE_THRESHOLD cosine of a cached one gets
+# the cached answer without an LLM call. Opt-in per request.
+
+RESPONSE_CACHE_THRESHOLD    = float(os.getenv("RESPONSE_CACHE_THRESHOLD", 0.92))
+RESPONSE_CACHE_TTL          = float(os.getenv("RESPONSE_CACHE_TTL", 3600))
+RESPONSE_CACHE_MAX_PER_USER = int(os.getenv("RESPONSE_CACHE_MAX_PER_USER", 100))
+RESPONSE_CACHE_MAX_USERS    = int(os.getenv("RESPONSE_CACHE_MAX_USERS", 1000))
+RESPONSE_CACHE_COMPLEXITIES = set(os.getenv("RESPONSE_CACHE_COMPLEXITIES", "simple").split(","))
+# Mid-session, shorter messages ("yes", "ok") depend on the conversation — never cached
+RESPONSE_CACHE_MIN_WORDS    = int(os.getenv("RESPONSE_CACHE_MIN_WORDS", 3))
+
+class ResponseCache:
+    def __init__(self):
+        self._users  = OrderedDict()   # user_id -> list of entries, LRU by user
+        self.hits    = 0
+        self.misses  = 0
+        self.saved_tokens = 0
+
+    def is_cacheable(self, message: str, complexity: str, working_memory: list) -> bool:
+        if complexity not in RESPONSE_CACHE_COMPLEXITIES:
+            return False
+        return not working_memory or len(message.split()) >= RESPONSE_CACHE_MIN_WORDS
+
+    def _live_entries(self, user_id: str) -> list:
+        entries = self._users.get(user_id)
+        if entries is None:
+            return []
+        cutoff  = time.time() - RESPONSE_CACHE_TTL
+        entries[:] = [e for e in entries if e["created_at"] >= cutoff]
+        self._users.move_to_end(user_id)
+        return entries
+
+    def lookup(self, user_id: str, query_embedding) -> dict:
+        """Best cached entry above the threshold, or None"""
+        entries = self._live_entries(user_id)
+        if not entries or query_embedding is None:
+            self.misses += 1
+            return None
+
+        query  = np.asarray(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = np.stack([e["embedding"] for e in entries]) @ query
+        best   = int(np.argmax(scores))
+        if scores[best] < RESPONSE_CACHE_THRESHOLD:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return {**entries[best], "similarity": float(scores[best])}
+
+    def store(self, user_id: str, query_embedding, question: str, answer: str, output_tokens: int):
+        if query_embedding is None:
+            return
+        vector  = np.asarray(query_embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+
+        entries = self._live_entries(user_id)
+        if user_id not in self._users:
+            self._users[user_id] = entries
+        entries.append({
+            "embedding":     vector,
+            "question":      question,
+            "answer":        answer,
+            "output_tokens": output_tokens,
+            "created_at":    time.time(),
+        })
+        del entries[:-RESPONSE_CACHE_MAX_PER_USER]
+        while len(self._users) > RESPONSE_CACHE_MAX_USERS:
+            self._users.popitem(last=False)
+
+    def record_saving(self, tokens: int):
+        self.saved_tokens += tokens
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "users":        len(self._users),
+            "entries":      sum(len(e) for e in self._users.values()),
+            "hits":         self.hits,
+            "misses":       self.misses,
+            "hit_rate":     round(self.hits / lookups * 100, 2) if lookups else 0,
+            "saved_tokens": self.saved_tokens,
+            "threshold":    RESPONSE_CACHE_THRESHOLD,
+        }
+
+response_cache = ResponseCache()
@@ -1,19 +1,45 @@
 import os
-from groq import Groq
-from app.memory.working import get_working_memory, clear_working_memory, is_memory_full
-from app.memory.episodic import save_episodic_memory, get_old_episodic_memories, archive_episodic_memory
-from app.memory.longterm import save_longterm_memory
+import asyncio
+from app.memory.working import (
+    get_working_memory, trim_working_memory, is_memory_full, get_session_summary,
+    get_aged_messages, fold_into_session_summary, SUMMARIZATION_MODE
+)
+from app.memory.episodic import save_episodic_memory, get_old_episodic_memories, archive_episodic_memories
+from app.memory.longterm import (
+    save_longterm_memory, compact_longterm_memory, list_longterm_users, migrate_legacy_collection
+)
+from app.memory.episodic_index import backfill_episodic_index
+from app.memory.fact_matrix import fact_matrix_cache
+from app.memory.versions import bump_memory_version
+from app.memory.jobs import enqueue_job, register_job_handler, JobDeferred
+from app.memory.locks import user_lock
+from app.utils.credentials import get_user_groq_key
+from app.utils.groq_clients import get_groq_client
+from app.utils.token_counter import count_tokens, message_tokens
 import json
 
+# Episodic → long-term promotion packs several summaries into one extraction
+# prompt (up to PROMOTION_BATCH_TOKENS of summary text) and makes at most
+# PROMOTION_MAX_CALLS such calls per user per run; the rest wait for the next run.
+PROMOTION_BATCH_TOKENS = int(os.getenv("PROMOTION_BATCH_TOKENS", 2000))
+PROMOTION_MAX_CALLS    = int(os.getenv("PROMOTION_MAX_CALLS", 3))
+# Rows loaded per run, oldest first — about what PROMOTION_MAX_CALLS batches hold
+# at PROMOTION_SUMMARY_TOKENS per summary; more would only be read and skipped
+PROMOTION_SUMMARY_TOKENS = int(os.getenv("PROMOTION_SUMMARY_TOKENS", 50))
+PROMOTION_MAX_ROWS       = PROMOTION_MAX_CALLS * PROMOTION_BATCH_TOKENS // PROMOTION_SUMMARY_TOKENS
+# Output cap for one extraction — sized to the facts JSON, not the batch; a
+# truncated reply fails to parse and the batch is retried next run
+PROMOTION_MAX_OUTPUT_TOKENS = int(os.getenv("PROMOTION_MAX_OUTPUT_TOKENS", 1024))
+
 async def summarize_conversation(messages: list, groq_api_key: str) -> tuple:
     """Use Groq to summarize a conversation — uses USER's api key"""
-    groq_client = Groq(api_key=groq_api_key)   # ✅ user's key
+    groq_client = get_groq_client(groq_api_key)   # ✅ user's key
 
     conversation_text = "\n".join([
         f"{m['role'].upper()}: {m['content']}" for m in messages
     ])
 
-    response = groq_client.chat.completions.create(
+    response = await groq_client.chat.completions.create(
         model="llama-3.3-70b-versatile",
         messages=[{
             "role": "user",
@@ -32,18 +58,55 @@ CONVERSATION:
     return summary, importance
 
 
+async def fold_conversation(running_summary: str, messages: list, groq_api_key: str) -> str:
+    """Fold messages into a running session summary — cost stays flat as the session grows"""
+    groq_client = get_groq_client(groq_api_key)   # ✅ user's key
+
+    conversation_text = "\n".join([
+        f"{m['role'].upper()}: {m['content']}" for m in messages
+    ])
+
+    response = await groq_client.chat.completions.create(
+        model="llama-3.3-70b-versatile",
+        messages=[{
+            "role": "user",
+            "content": f"""Update the running summary of this conversation with the new messages.
+Keep what still matters from the summary, add what the new messages contribute.
+Focus on: what the user is working on, problems discussed, solutions found, user preferences shown.
+Stay under 200 words. Output as plain text bullet points.
+
+RUNNING SUMMARY:
+{running_summary or "(none yet)"}
+
+NEW MESSAGES:
+{conversation_text}"""
+        }],
+        max_tokens=300
+    )
+
+    return response.choices[0].message.content
+
+
 async def extract_user_facts(summary: str, groq_api_key: str) -> dict:
     """Extract permanent user facts — uses USER's api key"""
-    groq_client = Groq(api_key=groq_api_key)   # ✅ user's key
+    return await extract_user_facts_batch([summary], groq_api_key) or {}
+
 
-    response = groq_client.chat.completions.create(
+async def extract_user_facts_batch(summaries: list, groq_api_key: str) -> dict:
+    """Extract permanent user facts from several summaries in ONE call — None if the reply didn't parse"""
+    groq_client = get_groq_client(groq_api_key)   # ✅ user's key
+
+    numbered = "\n".join(f"[{i}] {summary}" for i, summary in enumerate(summaries, 1))
+    response = await groq_client.chat.completions.create(
         model="llama-3.3-70b-versatile",
         messages=[{
             "role": "user",
-            "content": f"""From this conversation summary, extract permanent facts about the user.
-Return ONLY valid JSON, nothing else.
+            "content": f"""From these conversation summaries, extract permanent facts about the user.
+Return ONLY valid JSON, nothing else — one object covering all summaries.
+Summaries are oldest first; if they disagree, prefer the later one.
 
-Summary: {summary}
+Summaries:
+{numbered}
 
 Return JSON with these fields (use null if not mentioned):
 {{
@@ -55,7 +118,7 @@ Return JSON with these fields (use null if not mentioned):
   "background": null
 }}"""
         }],
-        max_tokens=200
+        max_tokens=PROMOTION_MAX_OUTPUT_TOKENS
     )
 
     try:
@@ -64,9 +127,106 @@ Return JSON with these fields (use null if not mentioned):
             facts_text = facts_text.split("```")[1]
             if facts_text.startswith("json"):
                 facts_text = facts_text[4:]
-        return json.loads(facts_text)
-    except:
-        return {}
+        facts = json.loads(facts_text)
+    except (json.JSONDecodeError, IndexError):
+        return None
+    return facts if isinstance(facts, dict) else None
+
+
+def merge_facts(merged: dict, facts: dict) -> dict:
+    """Fold one extraction into another — lists are unioned, later scalars win"""
+    for key, value in facts.items():
+        if not value:
+            continue
+        if isinstance(value, list) or isinstance(merged.get(key), list):
+            existing = merged.get(key) or []
+            existing = existing if isinstance(existing, list) else [existing]
+            items    = value if isinstance(value, list) else [value]
+            merged[key] = existing + [item for item in items if item not in existing]
+        else:
+            merged[key] = value
+    return merged
+
+
+def batch_summaries(memories: list, budget: int = PROMOTION_BATCH_TOKENS) -> list:
+    """Group memories, in order, so each group's summaries fit the token budget"""
+    batches, current, used = [], [], 0
+    for memory in memories:
+        tokens = count_tokens(memory.get("summary") or "")
+        if current and used + tokens > budget:
+            batches.append(current)
+            current, used = [], 0
+        current.append(memory)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def summarize_working_memory(user_id: str, session_id: str, groq_api_key: str) -> bool:
+    """Summarize a session (incl. its running summary) into episodic — False if it was empty"""
+    messages = await get_working_memory(user_id, session_id)
+    if not messages:
+        return False
+
+    running_summary = await get_session_summary(user_id, session_id)
+    if running_summary:
+        summary    = await fold_conversation(running_summary, messages, groq_api_key)
+        importance = min(1.0, len(summary) / 500)
+    else:
+        summary, importance = await summarize_conversation(messages, groq_api_key)
+    await save_episodic_memory(user_id, session_id, summary, importance)
+    # Only drop what was summarized — a chat may have appended meanwhile
+    await trim_working_memory(
+        user_id, session_id, len(messages),
+        tokens=sum(message_tokens(m) for m in messages), drop_summary=bool(running_summary)
+    )
+    print(f"✅ Promoted working memory → episodic for user {user_id}")
+    return True
+
+
+async def roll_working_memory(user_id: str, session_id: str, groq_api_key: str) -> bool:
+    """Fold the messages older than the verbatim window into the running summary"""
+    aged = await get_aged_messages(user_id, session_id)
+    if not aged:
+        return False
+
+    running_summary = await get_session_summary(user_id, session_id)
+    summary = await fold_conversation(running_summary, aged, groq_api_key)
+    await fold_into_session_summary(
+        user_id, session_id, summary, len(aged), tokens=sum(message_tokens(m) for m in aged)
+    )
+    print(f"✅ Folded {len(aged)} messages into the session summary for user {user_id}")
+    return True
+
+
+async def promote_episodic_memories(user_id: str, groq_api_key: str) -> int:
+    """Promote old episodic → long-term (batched, capped per run) — returns rows promoted"""
+    old_memories = await get_old_episodic_memories(user_id, days=7, limit=PROMOTION_MAX_ROWS)
+    batches = batch_summaries(old_memories)[:PROMOTION_MAX_CALLS]
+    if not batches:
+        return 0
+
+    # One failed call must not discard the other batches
+    extracted = await asyncio.gather(*(
+        extract_user_facts_batch([m["summary"] for m in batch], groq_api_key) for batch in batches
+    ), return_exceptions=True)
+
+    facts, promoted = {}, []
+    for batch, batch_facts in zip(batches, extracted):
+        if isinstance(batch_facts, BaseException) or batch_facts is None:
+            # Left unarchived — retried on the next run instead of silently lost
+            print(f"⚠️ Fact extraction failed for {len(batch)} episodic memories of user {user_id}: {batch_facts}")
+            continue
+        merge_facts(facts, batch_facts)
+        promoted.extend(m["id"] for m in batch)
+    if facts:
+        await save_longterm_memory(user_id, facts)
+
+    await archive_episodic_memories(user_id, promoted)
+    if promoted:
+        print(f"✅ Promoted {len(promoted)} episodic → long-term for user {user_id} ({len(batches)} LLM calls)")
+    return len(promoted)
 
 
 async def run_memory_lifecycle(user_id: str, session_id: str, groq_api_key: str):
@@ -74,20 +234,87 @@ async def run_memory_lifecycle(user_id: str, session_id: str, groq_api_key: str)
 
     # Step 1: Check if working memory is full
     if await is_memory_full(user_id, session_id):
-        messages = await get_working_memory(user_id, session_id)
-
-        if messages:
-            # Summarize and push to episodic
-            summary, importance = await summarize_conversation(messages, groq_api_key)
-            await save_episodic_memory(user_id, session_id, summary, importance)
-            await clear_working_memory(user_id, session_id)
-            print(f"✅ Promoted working memory → episodic for user {user_id}")
+        if SUMMARIZATION_MODE == "rolling":
+            # Session goes to episodic once idle (maintenance session sweep)
+            await roll_working_memory(user_id, session_id, groq_api_key)
+        else:
+            await summarize_working_memory(user_id, session_id, groq_api_key)
 
     # Step 2: Promote old episodic → long-term
-    old_memories = await get_old_episodic_memories(user_id, days=7)
-    for memory in old_memories:
-        facts = await extract_user_facts(memory["summary"], groq_api_key)
-        if facts:
-            await save_longterm_memory(user_id, facts)
-        await archive_episodic_memory(memory["id"])
-        print(f"✅ Promoted episodic → long-term for user {user_id}")
\ No newline at end of file
+    await promote_episodic_memories(user_id, groq_api_key)
+
+
+async def _memory_lifecycle_job(payload: dict):
+    """Job handler — looks the key up again so it never sits on disk decrypted"""
+    user_id, session_id = payload["user_id"], payload["session_id"]
+    groq_api_key = await get_user_groq_key(user_id)
+    if not groq_api_key:
+        print(f"⚠️ Skipping memory lifecycle for user {user_id} — no API key")
+        return
+    async with user_lock(user_id) as locked:
+        if not locked:
+            # Maintenance is working on this user — try again later without burning an attempt
+            raise JobDeferred(f"memory of user {user_id} is locked")
+        await run_memory_lifecycle(user_id, session_id, groq_api_key)
+
+register_job_handler("memory_lifecycle", _memory_lifecycle_job)
+
+
+async def enqueue_memory_lifecycle(user_id: str, session_id: str) -> bool:
+    """Schedule run_memory_lifecycle in the background — at most one pending per session"""
+    return await enqueue_job(
+        "memory_lifecycle",
+        {"user_id": user_id, "session_id": session_id},
+        dedup_key=f"memory_lifecycle:{user_id}:{session_id}"
+    )
+
+
+async def _longterm_compaction_job(payload: dict):
+    async with user_lock(payload["user_id"]) as locked:
+        if not locked:
+            raise JobDeferred(f"memory of user {payload['user_id']} is locked")
+        await compact_longterm_memory(payload["user_id"])
+
+register_job_handler("longterm_compaction", _longterm_compaction_job)
+
+
+async def enqueue_longterm_compaction(user_id: str) -> bool:
+    """Schedule a near-duplicate compaction of the user's long-term facts"""
+    return await enqueue_job(
+        "longterm_compaction",
+        {"user_id": user_id},
+        dedup_key=f"longterm_compaction:{user_id}"
+    )
+
+
+# ── One-off Chroma maintenance ────────────────────────────────
+# Chroma's local persistent mode is single-process: a second client on the
+# same path neither sees the API's loaded segments nor is safe to write
+# beside it. The scripts/ entry points only enqueue these, and the API's own
+# job workers run them against its open client.
+
+async def _migrate_longterm_partitions_job(payload: dict):
+    result = await asyncio.to_thread(migrate_legacy_collection, payload.get("batch_size", 500))
+    for user_id in result["users"]:
+        fact_matrix_cache.invalidate(user_id)
+        await bump_memory_version(user_id)
+    print(f"✅ Moved {result['rows']} long-term facts into {len(result['users'])} user partitions")
+
+register_job_handler("migrate_longterm_partitions", _migrate_longterm_partitions_job)
+
+
+async def _compact_all_longterm_job(payload: dict):
+    """Fan out one locked longterm_compaction job per user"""
+    users = await asyncio.to_thread(list_longterm_users)
+    for user_id in users:
+        await enqueue_longterm_compaction(user_id)
+    print(f"✅ Queued long-term compaction for {len(users)} users")
+
+register_job_handler("compact_all_longterm", _compact_all_longterm_job)
+
+
+async def _backfill_episodic_index_job(payload: dict):
+    indexed = await backfill_episodic_index(payload.get("batch_size", 200))
+    print(f"✅ Indexed {indexed} episodic memories")
+
+register_job_handler("backfill_episodic_index", _backfill_episodic_index_job)
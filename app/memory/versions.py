@@ -0,0 +1,20 @@
+from app.memory.working import redis
+
+# ── Per-user memory version ───────────────────────────────────
+# A Redis counter bumped whenever a user's episodic or long-term memory
+# changes. Anything derived from those layers (e.g. the memory graph) can be
+# cached per user and reused for as long as the version is unchanged —
+# across every worker, since the counter lives in Redis.
+
+def get_memory_version_key(user_id: str) -> str:
+    return f"memory_version:{user_id}"
+
+async def get_memory_version(user_id: str) -> int:
+    return int(await redis.get(get_memory_version_key(user_id)) or 0)
+
+async def bump_memory_version(user_id: str):
+    """Invalidate cached views of this user's memory — never fails the write"""
+    try:
+        await redis.incr(get_memory_version_key(user_id))
+    except Exception as e:
+        print(f"⚠️ Memory version bump failed for user {user_id}: {e}")
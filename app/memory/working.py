@@ -1,62 +1,298 @@
 import json
 import os
-from upstash_redis import Redis
+import time
+from upstash_redis.asyncio import Redis
+from upstash_redis.errors import UpstashError
+from app.utils.token_counter import count_tokens, message_tokens
 
 redis = Redis(
     url=os.getenv("UPSTASH_REDIS_REST_URL"),
     token=os.getenv("UPSTASH_REDIS_REST_TOKEN")
 )
 
-WORKING_MEMORY_LIMIT = int(os.getenv("WORKING_MEMORY_LIMIT", 10))
+# Working memory is "full" (due for summarization) at this many content tokens.
+# Each message stores its own count ("tokens") when written, and the session
+# keeps a running total of them, so checking it is one GET.
+WORKING_MEMORY_TOKEN_LIMIT = int(os.getenv("WORKING_MEMORY_TOKEN_LIMIT", 2000))
 WORKING_MEMORY_TTL = int(os.getenv("WORKING_MEMORY_TTL", 1800))
+# Optional hard cap on stored messages (LTRIM) — 0 keeps everything
+WORKING_MEMORY_MAX_MESSAGES = int(os.getenv("WORKING_MEMORY_MAX_MESSAGES", 0))
+# "rolling": once full, the oldest messages are folded into a running session
+# summary and the newest WORKING_MEMORY_KEEP_TOKENS worth stay verbatim.
+# "window": the whole window is summarized into episodic memory and dropped.
+SUMMARIZATION_MODE = os.getenv("SUMMARIZATION_MODE", "rolling")
+# A rolling session only reaches episodic memory through the maintenance
+# session sweep — without it the folded history would just expire
+if os.getenv("MAINTENANCE_ENABLED", "1") != "1":
+    SUMMARIZATION_MODE = "window"
+WORKING_MEMORY_KEEP_TOKENS = int(os.getenv("WORKING_MEMORY_KEEP_TOKENS", 800))
+WORKING_MEMORY_KEEP_MIN_MESSAGES = 2   # the last exchange always stays verbatim
+
+# Sessions used to be one JSON blob per key; they are now a Redis list with
+# one JSON message per element. Converts a blob key in place, atomically.
+_MIGRATE_BLOB_SCRIPT = """
+if redis.call('TYPE', KEYS[1]).ok ~= 'string' then return -1 end
+local ttl = redis.call('TTL', KEYS[1])
+local messages = cjson.decode(redis.call('GET', KEYS[1]))
+redis.call('DEL', KEYS[1])
+for _, m in ipairs(messages) do redis.call('RPUSH', KEYS[1], cjson.encode(m)) end
+if ttl > 0 and #messages > 0 then redis.call('EXPIRE', KEYS[1], ttl) end
+return #messages
+"""
+
+# Drop a session from the global activity index only if it hasn't been
+# written since the caller read its score
+_DEACTIVATE_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if score and tonumber(score) <= tonumber(ARGV[2]) then return redis.call('ZREM', KEYS[1], ARGV[1]) end
+return 0
+"""
+
+# Take trimmed tokens off the running total — a missing counter stays missing
+# (the next read re-seeds it from the list) and one that would go negative has
+# drifted, so it is dropped the same way
+_UNCOUNT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return -1 end
+local total = redis.call('DECRBY', KEYS[1], ARGV[1])
+if total < 0 then redis.call('DEL', KEYS[1]) return -1 end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return total
+"""
+
+# Global sorted set of "user_id:session_id", scored by last activity — lets
+# maintenance find idle sessions with one range read instead of a SCAN
+ACTIVE_SESSIONS_KEY = "active_sessions"
 
 def get_session_key(user_id: str, session_id: str) -> str:
     return f"session:{user_id}:{session_id}"
 
+def get_session_summary_key(user_id: str, session_id: str) -> str:
+    """Running summary of the messages already folded out of the session list"""
+    return f"session_summary:{user_id}:{session_id}"
+
+def get_session_summary_tokens_key(user_id: str, session_id: str) -> str:
+    """Token count of the running summary, stored when it is folded"""
+    return f"session_summary_tokens:{user_id}:{session_id}"
+
+def get_session_tokens_key(user_id: str, session_id: str) -> str:
+    """Running total of the content tokens in the session list — INCRBY on append, DECRBY on trim"""
+    return f"session_tokens:{user_id}:{session_id}"
+
+def get_session_index_key(user_id: str) -> str:
+    """Sorted set of a user's session ids, scored by last activity (unix time)"""
+    return f"sessions:{user_id}"
+
+async def migrate_blob_session(key: str) -> int:
+    """Convert a legacy JSON-blob session to a list — -1 if it wasn't a blob"""
+    return await redis.eval(_MIGRATE_BLOB_SCRIPT, keys=[key])
+
+async def migrate_all_blob_sessions() -> int:
+    """One-off sweep converting every legacy blob session — returns how many"""
+    migrated, cursor = 0, 0
+    while True:
+        cursor, keys = await redis.scan(cursor, match="session:*", count=500, type="string")
+        for key in keys:
+            if await migrate_blob_session(key) >= 0:
+                migrated += 1
+        if int(cursor) == 0:
+            return migrated
+
 async def get_working_memory(user_id: str, session_id: str) -> list:
     """Get all messages from current session"""
     key = get_session_key(user_id, session_id)
-    data = redis.get(key)
-    if data:
-        return json.loads(data)
-    return []
+    try:
+        items = await redis.lrange(key, 0, -1)
+    except UpstashError:
+        # WRONGTYPE — session still stored as a JSON blob
+        await migrate_blob_session(key)
+        items = await redis.lrange(key, 0, -1)
+    return [json.loads(item) for item in items]
+
+async def get_working_memory_and_summary(user_id: str, session_id: str) -> tuple:
+    """(messages, running session summary or None, its token count or None) in one round trip"""
+    key = get_session_key(user_id, session_id)
+
+    async def _read():
+        pipe = redis.pipeline()
+        pipe.lrange(key, 0, -1)
+        pipe.get(get_session_summary_key(user_id, session_id))
+        pipe.get(get_session_summary_tokens_key(user_id, session_id))
+        return await pipe.exec()
+
+    try:
+        items, summary, summary_tokens = await _read()
+    except UpstashError:
+        await migrate_blob_session(key)
+        items, summary, summary_tokens = await _read()
+    summary_tokens = int(summary_tokens) if summary and summary_tokens is not None else None
+    return [json.loads(item) for item in items], summary, summary_tokens
+
+async def get_session_summary(user_id: str, session_id: str) -> str:
+    return await redis.get(get_session_summary_key(user_id, session_id))
+
+def split_aged_messages(messages: list, keep_tokens: int = WORKING_MEMORY_KEEP_TOKENS) -> int:
+    """Index where the verbatim tail starts — the newest messages that fit `keep_tokens`"""
+    split, kept = len(messages), 0
+    while split > 0:
+        tokens = message_tokens(messages[split - 1])
+        if len(messages) - split >= WORKING_MEMORY_KEEP_MIN_MESSAGES and kept + tokens > keep_tokens:
+            break
+        kept  += tokens
+        split -= 1
+    # Start the tail on a user turn, so a reply is never kept without its question
+    while split > 0 and messages[split].get("role") != "user":
+        split -= 1
+    return split
+
+async def get_aged_messages(user_id: str, session_id: str, keep_tokens: int = WORKING_MEMORY_KEEP_TOKENS) -> list:
+    """Everything older than the verbatim tail — the part a rolling fold consumes"""
+    messages = await get_working_memory(user_id, session_id)
+    return messages[:split_aged_messages(messages, keep_tokens)]
+
+async def fold_into_session_summary(user_id: str, session_id: str, summary: str, count: int, tokens: int = 0):
+    """Store the new running summary and drop the `count` oldest messages (`tokens` in total) it now covers"""
+    tx = redis.multi()
+    tx.set(get_session_summary_key(user_id, session_id), summary, ex=WORKING_MEMORY_TTL)
+    tx.set(get_session_summary_tokens_key(user_id, session_id), count_tokens(summary), ex=WORKING_MEMORY_TTL)
+    tx.ltrim(get_session_key(user_id, session_id), count, -1)
+    tx.eval(_UNCOUNT_SCRIPT, keys=[get_session_tokens_key(user_id, session_id)], args=[str(tokens), str(WORKING_MEMORY_TTL)])
+    await tx.exec()
+
+async def add_messages_to_working_memory(user_id: str, session_id: str, messages: list) -> int:
+    """Append messages in one round trip (RPUSH + EXPIRE [+ LTRIM]) — returns new length.
+
+    Each message is stored with its token count; pass "tokens" when it is
+    already known (e.g. from the model's usage) to skip tokenizing it here.
+    """
+    key        = get_session_key(user_id, session_id)
+    index_key  = get_session_index_key(user_id)
+    tokens_key = get_session_tokens_key(user_id, session_id)
+    messages   = [{
+        **m, "tokens": m["tokens"] if m.get("tokens") is not None else count_tokens(m["content"])
+    } for m in messages]
+    values     = [json.dumps(m) for m in messages]
+    added      = sum(m["tokens"] for m in messages)
+
+    async def _append():
+        now = time.time()
+        tx  = redis.multi()
+        tx.rpush(key, *values)
+        tx.expire(key, WORKING_MEMORY_TTL)
+        tx.expire(get_session_summary_key(user_id, session_id), WORKING_MEMORY_TTL)
+        tx.expire(get_session_summary_tokens_key(user_id, session_id), WORKING_MEMORY_TTL)
+        tx.incrby(tokens_key, added)
+        tx.expire(tokens_key, WORKING_MEMORY_TTL)
+        if WORKING_MEMORY_MAX_MESSAGES > 0:
+            tx.ltrim(key, -WORKING_MEMORY_MAX_MESSAGES, -1)
+        # Session index — bumped with the write, lives as long as the newest session
+        tx.zadd(index_key, {session_id: now})
+        tx.zremrangebyscore(index_key, "-inf", now - WORKING_MEMORY_TTL)
+        tx.expire(index_key, WORKING_MEMORY_TTL)
+        tx.zadd(ACTIVE_SESSIONS_KEY, {f"{user_id}:{session_id}": now})
+        results = await tx.exec()
+        return results[0], results[4]
+
+    stale = False
+    try:
+        length, total = await _append()
+    except UpstashError:
+        # WRONGTYPE on RPUSH doesn't roll back the INCRBY queued after it —
+        # the counter has this turn already and none of the migrated messages
+        await migrate_blob_session(key)
+        length, total = await _append()
+        stale = True
+    if stale or 0 < WORKING_MEMORY_MAX_MESSAGES < length or (total == added and length > len(values)):
+        # The counter missed messages (blob migration, capped LTRIM, or a
+        # session older than the counter) — drop it so the next read re-seeds it
+        await redis.delete(tokens_key)
+    return length
 
 async def add_to_working_memory(
     user_id: str,
     session_id: str,
     role: str,
     content: str
-) -> list:
-    """Add a message to working memory"""
-    key = get_session_key(user_id, session_id)
-    messages = await get_working_memory(user_id, session_id)
-    
-    messages.append({
-        "role": role,
-        "content": content
-    })
-    
-    # Store back with TTL
-    redis.setex(key, WORKING_MEMORY_TTL, json.dumps(messages))
-    
-    return messages
+) -> int:
+    """Add a message to working memory — returns the new message count"""
+    return await add_messages_to_working_memory(
+        user_id, session_id, [{"role": role, "content": content}]
+    )
 
 async def clear_working_memory(user_id: str, session_id: str):
     """Clear session after summarization"""
     key = get_session_key(user_id, session_id)
-    redis.delete(key)
+    tx  = redis.multi()
+    tx.delete(
+        key, get_session_summary_key(user_id, session_id),
+        get_session_summary_tokens_key(user_id, session_id), get_session_tokens_key(user_id, session_id)
+    )
+    tx.zrem(get_session_index_key(user_id), session_id)
+    tx.zrem(ACTIVE_SESSIONS_KEY, f"{user_id}:{session_id}")
+    await tx.exec()
+
+async def trim_working_memory(user_id: str, session_id: str, count: int, tokens: int = 0, drop_summary: bool = False):
+    """Drop the oldest `count` messages (`tokens` in total) — keeps anything appended since they were read"""
+    tx = redis.multi()
+    tx.ltrim(get_session_key(user_id, session_id), count, -1)
+    tx.eval(_UNCOUNT_SCRIPT, keys=[get_session_tokens_key(user_id, session_id)], args=[str(tokens), str(WORKING_MEMORY_TTL)])
+    if drop_summary:
+        tx.delete(get_session_summary_key(user_id, session_id), get_session_summary_tokens_key(user_id, session_id))
+    await tx.exec()
+
+async def get_working_memory_length(user_id: str, session_id: str) -> int:
+    key = get_session_key(user_id, session_id)
+    try:
+        return await redis.llen(key)
+    except UpstashError:
+        await migrate_blob_session(key)
+        return await redis.llen(key)
+
+async def get_working_memory_tokens(user_id: str, session_id: str) -> int:
+    """Content tokens held by a session — one GET of the running total"""
+    tokens_key = get_session_tokens_key(user_id, session_id)
+    total      = await redis.get(tokens_key)
+    if total is not None:
+        return max(int(total), 0)
+    # Session written before the counter existed (or after a capped LTRIM) — seed it once
+    total = sum(message_tokens(m) for m in await get_working_memory(user_id, session_id))
+    await redis.set(tokens_key, total, nx=True, ex=WORKING_MEMORY_TTL)
+    return total
 
 async def is_memory_full(user_id: str, session_id: str) -> bool:
-    """Check if working memory hit limit"""
-    messages = await get_working_memory(user_id, session_id)
-    return len(messages) >= WORKING_MEMORY_LIMIT
+    """Check if working memory hit its token budget"""
+    return await get_working_memory_tokens(user_id, session_id) >= WORKING_MEMORY_TOKEN_LIMIT
+
+async def get_recent_sessions(user_id: str, limit: int = None) -> list:
+    """Active session IDs for a user, most recently used first"""
+    index_key = get_session_index_key(user_id)
+    stop      = -1 if limit is None else limit - 1
+
+    pipe = redis.pipeline()
+    pipe.zremrangebyscore(index_key, "-inf", time.time() - WORKING_MEMORY_TTL)
+    pipe.zrevrange(index_key, 0, stop)
+    _, sessions = await pipe.exec()
+    return sessions
 
 async def get_all_sessions(user_id: str) -> list:
     """Get all active session IDs for a user"""
-    pattern = f"session:{user_id}:*"
-    keys = redis.keys(pattern)
-    sessions = []
-    for key in keys:
-        session_id = key.split(":")[-1]
-        sessions.append(session_id)
-    return sessions
\ No newline at end of file
+    return await get_recent_sessions(user_id)
+
+async def get_idle_sessions(idle_seconds: int) -> list:
+    """(user_id, session_id, last activity) of live sessions with no writes for `idle_seconds`"""
+    now  = time.time()
+    pipe = redis.pipeline()
+    pipe.zremrangebyscore(ACTIVE_SESSIONS_KEY, "-inf", now - WORKING_MEMORY_TTL)
+    pipe.zrangebyscore(ACTIVE_SESSIONS_KEY, now - WORKING_MEMORY_TTL, now - idle_seconds, withscores=True)
+    _, idle = await pipe.exec()
+    return [(*member.split(":", 1), score) for member, score in idle]
+
+async def get_session_last_active(user_id: str, session_id: str) -> float:
+    """Unix time of the session's last write — None once it has left the activity index"""
+    score = await redis.zscore(ACTIVE_SESSIONS_KEY, f"{user_id}:{session_id}")
+    return None if score is None else float(score)
+
+async def deactivate_session(user_id: str, session_id: str, last_active: float) -> bool:
+    """Take a summarised session out of the idle sweep — unless it was written after `last_active`"""
+    return bool(await redis.eval(
+        _DEACTIVATE_SCRIPT, keys=[ACTIVE_SESSIONS_KEY], args=[f"{user_id}:{session_id}", str(last_active)]
+    ))
@@ -1,146 +1,327 @@
-import os
 import uuid
+import json
+import asyncio
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from groq import Groq
-from supabase import create_client
 
-from app.memory.working import get_working_memory, add_to_working_memory
-from app.memory.episodic import get_recent_episodic_memories
-from app.memory.longterm import search_longterm_memory
-from app.memory.scheduler import run_memory_lifecycle
+from app.memory.working import add_messages_to_working_memory
+from app.memory.context import assemble_context
+from app.memory.packer import pack_context
+from app.memory.response_cache import response_cache
+from app.memory.scheduler import enqueue_memory_lifecycle
 from app.cost.tracker import log_query_cost
 from app.cost.router import get_model_for_query, calculate_routing_savings
-from app.utils.encryption import decrypt_key
-from app.utils.token_counter import count_tokens
+from app.utils.credentials import get_user_groq_key
+from app.utils.groq_clients import get_groq_client
+from app.utils.token_counter import count_tokens, count_messages_tokens
 
 router = APIRouter()
 
-supabase = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_KEY")
-)
-
 class ChatRequest(BaseModel):
     message: str
     session_id: str = None
     user_id: str
+    use_cache: bool = False   # opt in to the semantic response cache
+
+async def _prepare_chat(request: ChatRequest, session_id: str) -> dict:
+    """Steps 1-4 — route the query, load memory and build the prompt"""
+    user_id = request.user_id
+
+    # Step 1 — Smart model routing 🔀
+    model_config = get_model_for_query(request.message)
+
+    # Step 2 + 3 — User's API key and all memory layers, fetched in parallel
+    groq_api_key, context = await asyncio.gather(
+        get_user_groq_key(user_id),
+        assemble_context(user_id, session_id, request.message, episodic_limit=5, longterm_top_k=5)
+    )
+
+    if not groq_api_key:
+        raise HTTPException(status_code=400, detail="No API key found. Add your Groq key in settings.")
+
+    # Step 3b — Fit the memory layers into this complexity's token budget
+    packed = pack_context(
+        context["working"],
+        context["episodic"],
+        context["longterm_scored"],
+        request.message,
+        model_config["context_budget"],
+        context["session_summary"],
+        context["session_summary_tokens"]
+    )
+    working_memory    = packed["working"]
+    episodic_memories = packed["episodic"]
+    longterm_facts    = packed["longterm"]
+
+    episodic_context = ""
+    if episodic_memories:
+        episodic_context = "PAST CONVERSATION SUMMARIES:\n" + \
+            "\n".join([f"- {m['summary']}" for m in episodic_memories])
+
+    longterm_context = ""
+    if longterm_facts:
+        longterm_context = "WHAT I KNOW ABOUT YOU:\n" + \
+            "\n".join([f"- {fact}" for fact in longterm_facts])
+
+    # Step 4 — Build prompt
+    system_prompt = "You are a helpful AI assistant with persistent memory."
+    if longterm_context:  system_prompt += f"\n\n{longterm_context}"
+    if episodic_context:  system_prompt += f"\n\n{episodic_context}"
+    if context["session_summary"]:
+        system_prompt += f"\n\nEARLIER IN THIS CONVERSATION:\n{context['session_summary']}"
+
+    messages = [{"role": "system", "content": system_prompt}]
+    # Stored messages carry a "tokens" count — Groq only takes role + content
+    messages.extend({"role": m["role"], "content": m["content"]} for m in working_memory)
+    messages.append({"role": "user", "content": request.message})
+
+    # Step 4b — Semantic response cache (opt-in)
+    cacheable = request.use_cache and response_cache.is_cacheable(
+        request.message, model_config["complexity"], context["working"]
+    )
+    cached = response_cache.lookup(user_id, context["query_embedding"]) if cacheable else None
+
+    return {
+        "model_config":      model_config,
+        "groq_client":       get_groq_client(groq_api_key),
+        "cacheable":         cacheable,
+        "cached":            cached,
+        "context":           context,
+        "packed":            packed,
+        "episodic_context":  episodic_context,
+        "longterm_context":  longterm_context,
+        "memory_hit":        bool(episodic_memories or longterm_facts),
+        "memory_layer_used": "longterm" if longterm_facts else ("episodic" if episodic_memories else None),
+        "messages":          messages,
+    }
+
+async def _finish_chat(
+    request: ChatRequest,
+    session_id: str,
+    prepared: dict,
+    assistant_message: str,
+    response_tokens: int = None
+) -> dict:
+    """Steps 6-9 — persist the turn, log cost and schedule the lifecycle"""
+    user_id      = request.user_id
+    model_config = prepared["model_config"]
+    context      = prepared["context"]
+    cached       = prepared["cached"]
+
+    # Token counts are stored with the messages, so no later turn re-tokenizes them
+    user_tokens = prepared["packed"]["user_message_tokens"]   # counted once, by the packer
+    if cached:
+        response_tokens = cached["output_tokens"]
+    if response_tokens is None:
+        response_tokens = count_tokens(assistant_message)
+
+    # Step 6 — Save to working memory (both turns in one round trip)
+    await add_messages_to_working_memory(user_id, session_id, [
+        {"role": "user",      "content": request.message,   "tokens": user_tokens},
+        {"role": "assistant", "content": assistant_message, "tokens": response_tokens},
+    ])
+
+    if cached:
+        # Served from the response cache — nothing was spent, report what was saved
+        await enqueue_memory_lifecycle(user_id, session_id)
+        return _cached_metadata(prepared, cached)
+
+    # Step 7 — Log cost
+    cost_log = await log_query_cost(
+        user_id=user_id,
+        session_id=session_id,
+        user_message=request.message,
+        response_text=assistant_message,
+        working_memory_messages=prepared["packed"]["working"],
+        episodic_context=prepared["episodic_context"],
+        longterm_context=prepared["longterm_context"],
+        model=model_config["label"],
+        memory_hit=prepared["memory_hit"],
+        memory_layer_used=prepared["memory_layer_used"],
+        response_tokens=response_tokens,
+        session_summary=context["session_summary"] or "",
+        user_tokens=user_tokens,
+        session_summary_tokens=context["session_summary_tokens"]
+    )
+
+    # Step 8 — Calculate routing savings
+    routing_savings = calculate_routing_savings(
+        request.message,
+        cost_log["working_memory_tokens"] + cost_log["user_message_tokens"],
+        cost_log["response_tokens"],
+        model_config["label"]
+    )
+
+    # Step 9 — Memory lifecycle (runs in the background job queue)
+    await enqueue_memory_lifecycle(user_id, session_id)
+
+    if prepared["cacheable"]:
+        response_cache.store(
+            user_id, context["query_embedding"], request.message,
+            assistant_message, cost_log["response_tokens"]
+        )
+
+    return {
+        "routing": {
+            "complexity":          model_config["complexity"],
+            "model_used":          model_config["label"],
+            "model_id":            model_config["model_id"],
+            "routing_saved":       routing_savings["routing_saved"],
+            "routing_savings_pct": routing_savings["routing_savings_pct"],
+        },
+        "memory_used": _memory_used(prepared),
+        "cost": {
+            "total_tokens":    cost_log["total_tokens"],
+            "actual_cost":     cost_log["actual_cost"],
+            "cost_saved":      cost_log["cost_saved"],
+            "savings_percent": cost_log["savings_percent"],
+            "cache_hit":       False,
+            "saved_tokens":    0,
+        }
+    }
+
+def _memory_used(prepared: dict) -> dict:
+    context = prepared["context"]
+    packed  = prepared["packed"]
+    return {
+        "working_messages":  len(packed["working"]),
+        "episodic_summaries": len(packed["episodic"]),
+        "longterm_facts":    len(packed["longterm"]),
+        "memory_hit":        prepared["memory_hit"],
+        "memory_layer_used": prepared["memory_layer_used"],
+        "session_summary":   bool(context["session_summary"]),
+        "timings_ms":        {name: t["ms"] for name, t in context["timings"].items()},
+        "degraded_layers":   [name for name, t in context["timings"].items() if t["status"] != "ok"],
+        "packing":           packed["report"],
+    }
+
+def _cached_metadata(prepared: dict, cached: dict) -> dict:
+    """Response metadata for a cache hit — the skipped call is reported as savings"""
+    model_config  = prepared["model_config"]
+    input_tokens  = count_messages_tokens(prepared["messages"])
+    output_tokens = cached["output_tokens"]
+    saved_cost    = input_tokens * model_config["cost_input"] + output_tokens * model_config["cost_output"]
+    response_cache.record_saving(input_tokens + output_tokens)
+
+    return {
+        "routing": {
+            "complexity":          model_config["complexity"],
+            "model_used":          "semantic cache",
+            "model_id":            None,
+            "routing_saved":       0,
+            "routing_savings_pct": 0,
+        },
+        "memory_used": _memory_used(prepared),
+        "cost": {
+            "total_tokens":     0,
+            "actual_cost":      0,
+            "cost_saved":       round(saved_cost, 8),
+            "savings_percent":  100,
+            "cache_hit":        True,
+            "saved_tokens":     input_tokens + output_tokens,
+            "cache_similarity": round(cached["similarity"], 4),
+        }
+    }
 
 @router.post("/chat")
 async def chat(request: ChatRequest):
     session_id = request.session_id or str(uuid.uuid4())
-    user_id    = request.user_id
 
     try:
-        # Step 1 — Get user's API key
-        key_result = supabase.table("user_api_keys")\
-            .select("groq_key_encrypted")\
-            .eq("user_id", user_id)\
-            .single().execute()
-
-        if not key_result.data or not key_result.data.get("groq_key_encrypted"):
-            raise HTTPException(status_code=400, detail="No API key found. Add your Groq key in settings.")
-
-        groq_api_key = decrypt_key(key_result.data["groq_key_encrypted"])
-
-        # Step 2 — Smart model routing 🔀
-        model_config = get_model_for_query(request.message)
-        model_id     = model_config["model_id"]
-        complexity   = model_config["complexity"]
-        max_tokens   = model_config["max_tokens"]
-
-        groq_client = Groq(api_key=groq_api_key)
-
-        # Step 3 — Fetch all memory layers
-        working_memory  = await get_working_memory(user_id, session_id)
-        episodic_memories = await get_recent_episodic_memories(user_id, limit=3)
-        longterm_facts  = await search_longterm_memory(user_id, request.message, top_k=3)
-
-        episodic_context = ""
-        if episodic_memories:
-            episodic_context = "PAST CONVERSATION SUMMARIES:\n" + \
-                "\n".join([f"- {m['summary']}" for m in episodic_memories])
-
-        longterm_context = ""
-        if longterm_facts:
-            longterm_context = "WHAT I KNOW ABOUT YOU:\n" + \
-                "\n".join([f"- {fact}" for fact in longterm_facts])
-
-        memory_hit        = bool(episodic_memories or longterm_facts)
-        memory_layer_used = "longterm" if longterm_facts else ("episodic" if episodic_memories else None)
-
-        # Step 4 — Build prompt
-        system_prompt = "You are a helpful AI assistant with persistent memory."
-        if longterm_context:  system_prompt += f"\n\n{longterm_context}"
-        if episodic_context:  system_prompt += f"\n\n{episodic_context}"
-
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(working_memory)
-        messages.append({"role": "user", "content": request.message})
-
-        # Step 5 — Call routed model
-        response = groq_client.chat.completions.create(
-            model=model_id,
-            messages=messages,
-            max_tokens=max_tokens
-        )
-        assistant_message = response.choices[0].message.content
-
-        # Step 6 — Save to working memory
-        await add_to_working_memory(user_id, session_id, "user",      request.message)
-        await add_to_working_memory(user_id, session_id, "assistant", assistant_message)
-
-        # Step 7 — Log cost
-        cost_log = await log_query_cost(
-            user_id=user_id,
-            session_id=session_id,
-            user_message=request.message,
-            response_text=assistant_message,
-            working_memory_messages=working_memory,
-            episodic_context=episodic_context,
-            longterm_context=longterm_context,
-            model=model_config["label"],
-            memory_hit=memory_hit,
-            memory_layer_used=memory_layer_used
-        )
+        prepared     = await _prepare_chat(request, session_id)
+        model_config = prepared["model_config"]
 
-        # Step 8 — Calculate routing savings
-        routing_savings = calculate_routing_savings(
-            request.message,
-            cost_log["working_memory_tokens"] + cost_log["user_message_tokens"],
-            cost_log["response_tokens"],
-            model_config["label"]
-        )
+        # Step 5 — Call routed model (unless the response cache answered)
+        response_tokens = None
+        if prepared["cached"]:
+            assistant_message = prepared["cached"]["answer"]
+        else:
+            response = await prepared["groq_client"].chat.completions.create(
+                model=model_config["model_id"],
+                messages=prepared["messages"],
+                max_tokens=model_config["max_tokens"]
+            )
+            assistant_message = response.choices[0].message.content
+            response_tokens   = response.usage.completion_tokens if response.usage else None
 
-        # Step 9 — Memory lifecycle
-        await run_memory_lifecycle(user_id, session_id, groq_api_key)
+        metadata = await _finish_chat(request, session_id, prepared, assistant_message, response_tokens)
 
         return {
             "response":    assistant_message,
             "session_id":  session_id,
-            "routing": {
-                "complexity":          complexity,
-                "model_used":          model_config["label"],
-                "model_id":            model_id,
-                "routing_saved":       routing_savings["routing_saved"],
-                "routing_savings_pct": routing_savings["routing_savings_pct"],
-            },
-            "memory_used": {
-                "working_messages":  len(working_memory),
-                "episodic_summaries": len(episodic_memories),
-                "longterm_facts":    len(longterm_facts),
-                "memory_hit":        memory_hit,
-                "memory_layer_used": memory_layer_used,
-            },
-            "cost": {
-                "total_tokens":    cost_log["total_tokens"],
-                "actual_cost":     cost_log["actual_cost"],
-                "cost_saved":      cost_log["cost_saved"],
-                "savings_percent": cost_log["savings_percent"],
-            }
+            **metadata
         }
 
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Same pipeline as /chat, but tokens are forwarded as Server-Sent Events.
+
+    Events: `start` (session_id), one `token` per delta, then `done` with the
+    routing / memory_used / cost metadata — or `error` if the stream fails.
+    """
+    session_id = request.session_id or str(uuid.uuid4())
+
+    try:
+        prepared = await _prepare_chat(request, session_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    model_config = prepared["model_config"]
+
+    async def event_stream():
+        yield _sse("start", {"session_id": session_id})
+
+        if prepared["cached"]:
+            answer = prepared["cached"]["answer"]
+            yield _sse("token", {"content": answer})
+            metadata = await _finish_chat(request, session_id, prepared, answer)
+            yield _sse("done", {"session_id": session_id, **metadata})
+            return
+
+        chunks        = []
+        output_tokens = 0      # running count from the deltas
+        usage_tokens  = None   # Groq's own count, sent on the final chunk
+        try:
+            # Step 5 — Stream the routed model
+            stream = await prepared["groq_client"].chat.completions.create(
+                model=model_config["model_id"],
+                messages=prepared["messages"],
+                max_tokens=model_config["max_tokens"],
+                stream=True
+            )
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    chunks.append(delta)
+                    output_tokens += count_tokens(delta)
+                    yield _sse("token", {"content": delta})
+
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq is not None and getattr(x_groq, "usage", None):
+                    usage_tokens = x_groq.usage.completion_tokens
+
+            metadata = await _finish_chat(
+                request, session_id, prepared, "".join(chunks),
+                response_tokens=usage_tokens if usage_tokens is not None else output_tokens
+            )
+            yield _sse("done", {"session_id": session_id, **metadata})
+
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,9 +1,52 @@
-from fastapi import APIRouter
-from app.cost.tracker import get_cost_analytics
+import csv
+import io
+import json
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from app.cost.tracker import get_cost_analytics, list_cost_logs, iter_cost_logs, RECENT_LOG_COLUMNS
 
 router = APIRouter()
 
 @router.get("/cost/analytics/{user_id}")
 async def get_analytics(user_id: str, days: int = 30):
     data = await get_cost_analytics(user_id, days)
-    return data
\ No newline at end of file
+    return data
+
+@router.get("/cost/logs/{user_id}")
+async def get_cost_logs(user_id: str, limit: int = 50, cursor: str = None):
+    """Page through query history — pass back `next_cursor` for the next page"""
+    limit = max(1, min(limit, 200))
+    try:
+        return await list_cost_logs(user_id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/cost/logs/{user_id}/export")
+async def export_cost_logs(user_id: str, format: str = "ndjson"):
+    """Stream the full history as NDJSON or CSV without buffering it in memory"""
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+
+    fields = RECENT_LOG_COLUMNS.split(",")
+
+    async def ndjson_rows():
+        async for page in iter_cost_logs(user_id):
+            yield "".join(json.dumps(row) + "\n" for row in page)
+
+    async def csv_rows():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        async for page in iter_cost_logs(user_id):
+            writer.writerows(page)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(
+        ndjson_rows() if format == "ndjson" else csv_rows(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="cost_logs_{user_id}.{format}"'}
+    )
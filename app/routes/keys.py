@@ -1,17 +1,12 @@
-import os
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from supabase import create_client
+from app.utils.db import get_supabase
 from app.utils.encryption import encrypt_key
+from app.utils.credentials import invalidate_user_key
 import uuid
 
 router = APIRouter()
 
-supabase = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_KEY")
-)
-
 class ApiKeyRequest(BaseModel):
     user_id: str
     groq_key: str
@@ -30,24 +25,26 @@ async def save_api_key(request: ApiKeyRequest):
 
         encrypted = encrypt_key(request.groq_key)
 
-        existing = supabase.table("user_api_keys")\
+        supabase = await get_supabase()
+        existing = await supabase.table("user_api_keys")\
             .select("id")\
             .eq("user_id", request.user_id)\
             .execute()
 
         if existing.data:
-            supabase.table("user_api_keys")\
+            await supabase.table("user_api_keys")\
                 .update({"groq_key_encrypted": encrypted})\
                 .eq("user_id", request.user_id)\
                 .execute()
         else:
-            supabase.table("user_api_keys")\
+            await supabase.table("user_api_keys")\
                 .insert({
                     "user_id": request.user_id,
                     "groq_key_encrypted": encrypted
                 })\
                 .execute()
 
+        invalidate_user_key(request.user_id)
         return {"message": "API key saved successfully ✅"}
 
     except HTTPException:
@@ -0,0 +1,18 @@
+from fastapi import APIRouter
+from app.memory.longterm import embedding_cache, embedding_batcher
+from app.memory.fact_matrix import fact_matrix_cache
+from app.memory.response_cache import response_cache
+from app.cost.sink import cost_log_sink
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def get_metrics():
+    """In-process performance counters for this worker"""
+    return {
+        "embedding_cache":   embedding_cache.stats(),
+        "embedding_batcher": embedding_batcher.stats(),
+        "fact_matrix":       fact_matrix_cache.stats(),
+        "response_cache":    response_cache.stats(),
+        "cost_log_sink":     cost_log_sink.stats(),
+    }
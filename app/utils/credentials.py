@@ -0,0 +1,49 @@
+import os
+import time
+from collections import OrderedDict
+from postgrest.exceptions import APIError
+from app.utils.db import get_supabase
+from app.utils.encryption import decrypt_key
+
+# Decrypted keys are held in memory briefly so a chat doesn't cost a DB
+# round trip + decrypt every message. /api/save-key invalidates locally;
+# other workers pick the new key up when their entry expires.
+USER_KEY_CACHE_TTL  = float(os.getenv("USER_KEY_CACHE_TTL", 300))
+USER_KEY_CACHE_SIZE = int(os.getenv("USER_KEY_CACHE_SIZE", 10000))
+
+_key_cache = OrderedDict()   # user_id -> (expires_at, groq_key)
+
+def invalidate_user_key(user_id: str):
+    """Drop a cached key — call after the user's key changes"""
+    _key_cache.pop(user_id, None)
+
+async def get_user_groq_key(user_id: str) -> str:
+    """Fetch and decrypt a user's Groq key — None if they haven't saved one"""
+    cached = _key_cache.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        _key_cache.move_to_end(user_id)
+        return cached[1]
+
+    supabase = await get_supabase()
+    try:
+        result = await supabase.table("user_api_keys")\
+            .select("groq_key_encrypted")\
+            .eq("user_id", user_id)\
+            .single().execute()
+    except APIError as e:
+        # .single() raises PGRST116 when the user has no row — anything
+        # else (timeouts, auth, schema) is a real failure, not a missing key
+        if e.code == "PGRST116":
+            return None
+        raise
+
+    if not result.data or not result.data.get("groq_key_encrypted"):
+        return None
+    groq_key = decrypt_key(result.data["groq_key_encrypted"])
+
+    # Only hits are cached — a user who just added a key must not see a stale miss
+    _key_cache[user_id] = (time.monotonic() + USER_KEY_CACHE_TTL, groq_key)
+    _key_cache.move_to_end(user_id)
+    while len(_key_cache) > USER_KEY_CACHE_SIZE:
+        _key_cache.popitem(last=False)
+    return groq_key
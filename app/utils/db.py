@@ -0,0 +1,14 @@
+import os
+from supabase import acreate_client, AsyncClient
+
+_supabase: AsyncClient = None
+
+async def get_supabase() -> AsyncClient:
+    """Shared async Supabase client — created once per process"""
+    global _supabase
+    if _supabase is None:
+        _supabase = await acreate_client(
+            os.getenv("SUPABASE_URL"),
+            os.getenv("SUPABASE_SERVICE_KEY")
+        )
+    return _supabase
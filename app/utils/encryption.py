@@ -1,11 +1,16 @@
 import os
+from functools import lru_cache
 from cryptography.fernet import Fernet
 
+@lru_cache(maxsize=1)
+def _fernet_for(key: str) -> Fernet:
+    return Fernet(key.encode())
+
 def get_fernet():
     key = os.getenv("ENCRYPTION_KEY")
     if not key:
         raise ValueError("ENCRYPTION_KEY not set in .env")
-    return Fernet(key.encode())
+    return _fernet_for(key)
 
 def encrypt_key(api_key: str) -> str:
     """Encrypt an API key before storing"""
@@ -0,0 +1,47 @@
+import os
+from collections import OrderedDict
+import httpx
+from groq import AsyncGroq
+
+# One AsyncGroq per API key, all sharing a single httpx connection pool so
+# requests reuse keep-alive connections instead of a new TLS handshake each.
+GROQ_CLIENT_POOL_SIZE     = int(os.getenv("GROQ_CLIENT_POOL_SIZE", 256))
+GROQ_MAX_CONNECTIONS      = int(os.getenv("GROQ_MAX_CONNECTIONS", 100))
+GROQ_MAX_KEEPALIVE        = int(os.getenv("GROQ_MAX_KEEPALIVE", 20))
+
+_http_client = None
+_clients     = OrderedDict()   # api_key -> AsyncGroq, LRU order
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=GROQ_MAX_CONNECTIONS,
+                max_keepalive_connections=GROQ_MAX_KEEPALIVE
+            ),
+            timeout=httpx.Timeout(60.0, connect=5.0)
+        )
+    return _http_client
+
+def get_groq_client(api_key: str) -> AsyncGroq:
+    """Pooled AsyncGroq client for this key"""
+    client = _clients.get(api_key)
+    if client is not None:
+        _clients.move_to_end(api_key)
+        return client
+
+    client = AsyncGroq(api_key=api_key, http_client=_get_http_client())
+    _clients[api_key] = client
+    # Evicted clients just drop their reference — the shared pool stays open
+    while len(_clients) > GROQ_CLIENT_POOL_SIZE:
+        _clients.popitem(last=False)
+    return client
+
+async def close_groq_clients():
+    """Close the shared connection pool — call on shutdown"""
+    global _http_client
+    _clients.clear()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
@@ -0,0 +1,22 @@
+import bisect
+
+class Histogram:
+    """Fixed-bucket histogram — counts[i] is the number of values <= buckets[i]"""
+
+    def __init__(self, buckets: list):
+        self.buckets = list(buckets)
+        self.counts  = [0] * (len(self.buckets) + 1)   # last slot is +Inf
+        self.count   = 0
+        self.sum     = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum   += value
+
+    def snapshot(self) -> dict:
+        return {
+            "buckets": {str(b): c for b, c in zip(self.buckets + ["+Inf"], self.counts)},
+            "count":   self.count,
+            "mean":    round(self.sum / self.count, 3) if self.count else 0,
+        }
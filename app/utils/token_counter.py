@@ -1,4 +1,7 @@
+import hashlib
+import os
 import tiktoken
+from collections import OrderedDict
 
 # Pricing per token (as of 2025)
 MODEL_PRICING = {
@@ -21,11 +24,34 @@ def count_tokens(text: str) -> int:
     encoder = tiktoken.get_encoding("cl100k_base")
     return len(encoder.encode(text))
 
+# Keyed by a digest of the text, so an entry costs ~100 bytes however large
+# the text was — a pasted file can't pin megabytes in every worker
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 8192))
+_token_cache = OrderedDict()   # sha256 digest -> token count
+
+def count_tokens_cached(text: str) -> int:
+    """count_tokens memoized by content hash — for snippets that recur every turn"""
+    key    = hashlib.sha256(text.encode("utf-8")).digest()
+    tokens = _token_cache.get(key)
+    if tokens is None:
+        tokens = count_tokens(text)
+        _token_cache[key] = tokens
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    else:
+        _token_cache.move_to_end(key)
+    return tokens
+
+def message_tokens(message: dict) -> int:
+    """Content tokens of a chat message — the count stored at write time if it has one"""
+    tokens = message.get("tokens")
+    return tokens if tokens is not None else count_tokens_cached(message.get("content", ""))
+
 def count_messages_tokens(messages: list) -> int:
     """Count total tokens in a list of messages"""
     total = 0
     for msg in messages:
-        total += count_tokens(msg.get("content", ""))
+        total += message_tokens(msg)
         total += 4  # overhead per message
     return total
 
@@ -0,0 +1,69 @@
+"""Input tokens per turn with and without the context packer.
+
+    python -m benchmarks.context_packing
+
+Replays a synthetic session turn by turn: working memory grows by one
+exchange per turn (nothing is summarized away), with a fixed set of
+episodic summaries and long-term facts. Prints the prompt size the old
+"concatenate everything" assembly would send vs the packed prompt.
+"""
+import random
+import time
+
+from app.cost.router import MODEL_CONFIG
+from app.memory.packer import pack_context
+from app.utils.token_counter import count_messages_tokens
+
+random.seed(7)
+
+WORDS = ("memory redis vector embedding fastapi latency token budget prompt session "
+         "user summary index cache query model groq chroma async worker").split()
+
+def _text(n_words: int) -> str:
+    return " ".join(random.choice(WORDS) for _ in range(n_words))
+
+EPISODIC = [{"summary": _text(80), "importance_score": random.random()} for _ in range(5)]
+LONGTERM = [(f"skills: {_text(6)}", random.uniform(0.2, 0.7)) for _ in range(5)]
+
+def _unpacked_tokens(working: list, message: str) -> int:
+    """Mirrors the pre-packer prompt: every fact, every summary, whole working memory"""
+    system = "You are a helpful AI assistant with persistent memory."
+    system += "\n\nWHAT I KNOW ABOUT YOU:\n" + "\n".join(f"- {f}" for f, _ in LONGTERM)
+    system += "\n\nPAST CONVERSATION SUMMARIES:\n" + "\n".join(f"- {m['summary']}" for m in EPISODIC)
+    messages = [{"role": "system", "content": system}] + working + [{"role": "user", "content": message}]
+    return count_messages_tokens(messages)
+
+def main(turns: int = 40):
+    working = []
+    totals  = {c: [0, 0] for c in MODEL_CONFIG}
+    pack_ms = []
+
+    print(f"{'turn':>4} " + " ".join(f"{c:>18}" for c in MODEL_CONFIG))
+    for turn in range(1, turns + 1):
+        message = _text(random.randint(5, 40))
+        row = []
+        for complexity, config in MODEL_CONFIG.items():
+            start  = time.perf_counter()
+            packed = pack_context(working, EPISODIC, LONGTERM, message, config["context_budget"])
+            pack_ms.append((time.perf_counter() - start) * 1000)
+
+            before = _unpacked_tokens(working, message)
+            after  = packed["report"]["used_tokens"]
+            totals[complexity][0] += before
+            totals[complexity][1] += after
+            row.append(f"{before:>8} → {after:<7}")
+        if turn % 5 == 0:
+            print(f"{turn:>4} " + " ".join(row))
+
+        working.append({"role": "user", "content": message})
+        working.append({"role": "assistant", "content": _text(random.randint(40, 250))})
+
+    print()
+    for complexity, (before, after) in totals.items():
+        print(f"{complexity:>8}: {before:>8} → {after:>8} input tokens "
+              f"({(1 - after / before) * 100:.1f}% fewer, budget {MODEL_CONFIG[complexity]['context_budget']})")
+    pack_ms.sort()
+    print(f"pack_context p50 {pack_ms[len(pack_ms) // 2]:.3f} ms, p99 {pack_ms[int(len(pack_ms) * 0.99)]:.3f} ms")
+
+if __name__ == "__main__":
+    main()
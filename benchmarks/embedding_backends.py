@@ -0,0 +1,104 @@
+"""Compare embedding backends — latency, peak RSS and cosine parity vs torch.
+
+    python -m benchmarks.embedding_backends [--backends torch onnx ...]
+
+Each backend runs in its own subprocess so RSS numbers aren't polluted by
+the others.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+def _rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+# Taken before app.memory.embedder pulls in sentence-transformers / torch, so
+# rss_model_mb covers the whole backend, not just the weights
+RSS_BASELINE_MB = _rss_mb()
+
+from app.memory.embedder import EMBEDDING_BACKENDS, cosine_agreement, load_embedder
+
+TEXTS = [
+    "user profile facts",
+    "user facts skills projects",
+    "skills: Python",
+    "current_projects: a FastAPI backend with layered memory",
+    "goals: ship the MemVault dashboard before the demo",
+    "What is a transformer?",
+    "How do I add Redis caching to my FastAPI app?",
+    "Explain the difference between HNSW and brute-force vector search in detail.",
+    "preferences: concise answers with code examples",
+    "background: final-year computer science student",
+] * 5
+
+def run_backend(backend: str, out_path: str):
+    start  = time.perf_counter()
+    model  = load_embedder(backend)
+    load_s = time.perf_counter() - start
+
+    model.encode(TEXTS[:2])   # warm-up
+
+    single = []
+    for text in TEXTS:
+        t0 = time.perf_counter()
+        model.encode(text)
+        single.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    vectors = model.encode(TEXTS)
+    batch_ms = (time.perf_counter() - t0) * 1000
+
+    np.save(out_path, np.asarray(vectors, dtype=np.float32))
+    print(json.dumps({
+        "backend":        backend,
+        "load_s":         round(load_s, 2),
+        "single_p50_ms":  round(float(np.percentile(single, 50)), 2),
+        "single_p95_ms":  round(float(np.percentile(single, 95)), 2),
+        "batch_ms":       round(batch_ms, 2),
+        "batch_size":     len(TEXTS),
+        "rss_model_mb":   round(_rss_mb() - RSS_BASELINE_MB, 1),
+        "rss_peak_mb":    round(_rss_mb(), 1),
+    }))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS))
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_backend(args.worker, args.out)
+        return
+
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+    results, vectors = [], {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in backends:
+            out  = os.path.join(tmp, f"{backend}.npy")
+            proc = subprocess.run(
+                [sys.executable, "-m", "benchmarks.embedding_backends", "--worker", backend, "--out", out],
+                capture_output=True, text=True
+            )
+            if proc.returncode != 0:
+                stderr = proc.stderr.strip().splitlines()
+                print(f"⚠️ {backend} failed:\n{stderr[-1] if stderr else f'exit code {proc.returncode}'}")
+                continue
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            vectors[backend] = np.load(out)
+
+    for result in results:
+        result["cosine_vs_torch"] = cosine_agreement(vectors["torch"], vectors[result["backend"]]) \
+            if "torch" in vectors else None
+        print(json.dumps(result))
+
+if __name__ == "__main__":
+    main()
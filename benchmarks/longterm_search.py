@@ -0,0 +1,61 @@
+"""Long-term fact search: NumPy brute force vs a Chroma HNSW query.
+
+    python -m benchmarks.longterm_search
+
+Fills a throwaway partition with random 384-d unit vectors (the
+all-MiniLM-L6-v2 width) at each fact count and times a top-5 query both
+ways. Also reports how often HNSW's top-5 matches the exact answer. Use it
+to pick LONGTERM_BRUTE_FORCE_MAX for your hardware.
+"""
+import statistics
+import time
+import chromadb
+import numpy as np
+
+from app.memory.fact_matrix import normalize_rows, top_k_cosine
+
+DIM         = 384
+TOP_K       = 5
+QUERIES     = 200
+FACT_COUNTS = [10, 50, 100, 250, 500, 1000, 2500, 5000]
+
+rng = np.random.default_rng(7)
+
+def _percentiles(samples: list) -> str:
+    samples = sorted(samples)
+    return f"p50 {statistics.median(samples):7.3f} ms  p99 {samples[int(len(samples) * 0.99)]:7.3f} ms"
+
+def main():
+    client = chromadb.EphemeralClient()
+    print(f"{'facts':>6}  {'numpy':>32}  {'chroma':>32}  {'recall@5':>8}")
+    for n in FACT_COUNTS:
+        vectors = normalize_rows(rng.standard_normal((n, DIM)))
+        queries = normalize_rows(rng.standard_normal((QUERIES, DIM)))
+
+        collection = client.create_collection(name=f"bench_{n}", metadata={"hnsw:space": "cosine"})
+        for start in range(0, n, 1000):
+            chunk = vectors[start:start + 1000]
+            collection.add(
+                ids=[str(i) for i in range(start, start + len(chunk))],
+                embeddings=chunk.tolist(),
+                documents=[f"fact {i}" for i in range(start, start + len(chunk))]
+            )
+
+        numpy_ms, chroma_ms, recall = [], [], []
+        for query in queries:
+            start = time.perf_counter()
+            exact = top_k_cosine(vectors, query, TOP_K)
+            numpy_ms.append((time.perf_counter() - start) * 1000)
+
+            start  = time.perf_counter()
+            result = collection.query(query_embeddings=[query.tolist()], n_results=min(TOP_K, n))
+            chroma_ms.append((time.perf_counter() - start) * 1000)
+
+            exact_ids = {str(i) for i, _ in exact}
+            recall.append(len(exact_ids & set(result["ids"][0])) / len(exact_ids))
+
+        print(f"{n:>6}  {_percentiles(numpy_ms):>32}  {_percentiles(chroma_ms):>32}  {statistics.mean(recall):>8.3f}")
+        client.delete_collection(name=f"bench_{n}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""Embed and index existing episodic summaries for relevance-ranked retrieval.
+
+    python -m scripts.backfill_episodic_index [batch_size]
+
+Queues the backfill on the API's job queue (same JOBS_DB_PATH) — Chroma's
+local persistent mode is single-process, so the running API writes the index
+with its own client. Idempotent: rows already in the index are skipped, so
+re-running it only embeds what is missing.
+"""
+import asyncio
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.memory.jobs import enqueue_job
+
+if __name__ == "__main__":
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    queued = asyncio.run(enqueue_job(
+        "backfill_episodic_index", {"batch_size": batch_size}, dedup_key="backfill_episodic_index"
+    ))
+    print("✅ Queued episodic index backfill" if queued else "⚠️ Backfill is already pending")
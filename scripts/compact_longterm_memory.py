@@ -0,0 +1,20 @@
+"""Merge near-duplicate long-term facts and re-key them by content hash.
+
+    python -m scripts.compact_longterm_memory
+
+Run once after upgrading from per-process hash() ids — it collapses the
+duplicates every restart used to write — and then whenever the index
+looks bloated. Queues one locked compaction job per user on the API's job
+queue (same JOBS_DB_PATH); Chroma's local persistent mode is single-process,
+so the running API does the work with its own client and logs the results.
+"""
+import asyncio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.memory.jobs import enqueue_job
+
+if __name__ == "__main__":
+    queued = asyncio.run(enqueue_job("compact_all_longterm", {}, dedup_key="compact_all_longterm"))
+    print("✅ Queued long-term compaction" if queued else "⚠️ Compaction is already pending")
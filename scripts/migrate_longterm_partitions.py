@@ -0,0 +1,23 @@
+"""Split the shared `user_longterm_memory` collection into per-user partitions.
+
+    python -m scripts.migrate_longterm_partitions [batch_size]
+
+Queues the migration on the API's durable job queue (same JOBS_DB_PATH) —
+Chroma's local persistent mode is single-process, so the running API does
+the copy with its own client. Stored embeddings are copied, nothing is
+re-encoded, and searches keep merging in the shared collection until it is gone.
+"""
+import asyncio
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.memory.jobs import enqueue_job
+
+if __name__ == "__main__":
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    queued = asyncio.run(enqueue_job(
+        "migrate_longterm_partitions", {"batch_size": batch_size}, dedup_key="migrate_longterm_partitions"
+    ))
+    print("✅ Queued long-term partition migration" if queued else "⚠️ Migration is already pending")
@@ -0,0 +1,17 @@
+"""Convert legacy JSON-blob working-memory sessions to Redis lists.
+
+    python -m scripts.migrate_working_memory
+
+Safe to run while the API is serving — reads and writes also migrate a
+blob key lazily the first time they touch it.
+"""
+import asyncio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.memory.working import migrate_all_blob_sessions
+
+if __name__ == "__main__":
+    migrated = asyncio.run(migrate_all_blob_sessions())
+    print(f"✅ Migrated {migrated} working-memory sessions to lists")
@@ -0,0 +1,17 @@
+"""Re-insert cost_logs rows the sink dead-lettered.
+
+    python -m scripts.replay_cost_dead_letters
+
+Run after fixing whatever made Postgres reject them (or once it is reachable
+again). Rows that still fail are kept in the file with the new error.
+"""
+import asyncio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.cost.sink import replay_dead_letters
+
+if __name__ == "__main__":
+    result = asyncio.run(replay_dead_letters())
+    print(f"✅ Replayed {result['replayed']} cost logs, {result['remaining']} still failing")
@@ -0,0 +1,4 @@
+-- Supports keyset pagination of a user's history on (timestamp, query_id)
+-- in either direction (/api/cost/logs and its export).
+create index if not exists cost_logs_user_ts_query_idx
+    on cost_logs (user_id, timestamp, query_id);
@@ -0,0 +1,120 @@
+-- ── Daily cost rollups ──────────────────────────────────────
+-- One row per (user, UTC day, model), incremented in the same transaction
+-- that inserts the raw cost_logs rows. /api/cost/analytics reads these
+-- instead of scanning cost_logs. Run once in the Supabase SQL editor.
+
+create table if not exists cost_daily_rollups (
+    user_id                 text             not null,
+    day                     date             not null,
+    model_used              text             not null,
+    queries                 bigint           not null default 0,
+    memory_hits             bigint           not null default 0,
+    working_memory_tokens   bigint           not null default 0,
+    episodic_memory_tokens  bigint           not null default 0,
+    longterm_memory_tokens  bigint           not null default 0,
+    user_message_tokens     bigint           not null default 0,
+    response_tokens         bigint           not null default 0,
+    total_tokens            bigint           not null default 0,
+    actual_cost             double precision not null default 0,
+    naive_cost              double precision not null default 0,
+    cost_saved              double precision not null default 0,
+    savings_percent_sum     double precision not null default 0,
+    primary key (user_id, day, model_used)
+);
+
+-- Bulk insert used by the cost log sink: raw rows + rollup increments, atomically
+create or replace function insert_cost_logs(rows jsonb) returns void
+language sql as $$
+    with inserted as (
+        insert into cost_logs (
+            user_id, query_id, session_id, timestamp,
+            working_memory_tokens, episodic_memory_tokens, longterm_memory_tokens,
+            user_message_tokens, response_tokens, total_tokens,
+            actual_cost, naive_cost, cost_saved, savings_percent,
+            model_used, memory_hit, memory_layer_used
+        )
+        select
+            user_id, query_id, session_id, coalesce(timestamp, now()),
+            working_memory_tokens, episodic_memory_tokens, longterm_memory_tokens,
+            user_message_tokens, response_tokens, total_tokens,
+            actual_cost, naive_cost, cost_saved, savings_percent,
+            model_used, memory_hit, memory_layer_used
+        from jsonb_populate_recordset(null::cost_logs, rows)
+        returning *
+    )
+    insert into cost_daily_rollups as r
+    select
+        user_id::text,
+        (timestamp at time zone 'utc')::date,
+        coalesce(model_used, 'unknown'),
+        count(*),
+        count(*) filter (where memory_hit),
+        coalesce(sum(working_memory_tokens), 0),
+        coalesce(sum(episodic_memory_tokens), 0),
+        coalesce(sum(longterm_memory_tokens), 0),
+        coalesce(sum(user_message_tokens), 0),
+        coalesce(sum(response_tokens), 0),
+        coalesce(sum(total_tokens), 0),
+        coalesce(sum(actual_cost), 0),
+        coalesce(sum(naive_cost), 0),
+        coalesce(sum(cost_saved), 0),
+        coalesce(sum(savings_percent), 0)
+    from inserted
+    group by 1, 2, 3
+    on conflict (user_id, day, model_used) do update set
+        queries                = r.queries                + excluded.queries,
+        memory_hits            = r.memory_hits            + excluded.memory_hits,
+        working_memory_tokens  = r.working_memory_tokens  + excluded.working_memory_tokens,
+        episodic_memory_tokens = r.episodic_memory_tokens + excluded.episodic_memory_tokens,
+        longterm_memory_tokens = r.longterm_memory_tokens + excluded.longterm_memory_tokens,
+        user_message_tokens    = r.user_message_tokens    + excluded.user_message_tokens,
+        response_tokens        = r.response_tokens        + excluded.response_tokens,
+        total_tokens           = r.total_tokens           + excluded.total_tokens,
+        actual_cost            = r.actual_cost            + excluded.actual_cost,
+        naive_cost             = r.naive_cost             + excluded.naive_cost,
+        cost_saved             = r.cost_saved             + excluded.cost_saved,
+        savings_percent_sum    = r.savings_percent_sum    + excluded.savings_percent_sum;
+$$;
+
+-- Backfill / repair from existing history. Every rollup row it touches is
+-- recomputed from cost_logs, so it is correct whether it runs before or after
+-- the sink starts writing rollups, and it can be re-run at any time. The
+-- SHARE lock holds off concurrent insert_cost_logs calls for the duration, so
+-- no increment lands between the aggregate and the overwrite.
+begin;
+lock table cost_logs in share mode;
+
+insert into cost_daily_rollups
+select
+    user_id::text,
+    (timestamp at time zone 'utc')::date,
+    coalesce(model_used, 'unknown'),
+    count(*),
+    count(*) filter (where memory_hit),
+    coalesce(sum(working_memory_tokens), 0),
+    coalesce(sum(episodic_memory_tokens), 0),
+    coalesce(sum(longterm_memory_tokens), 0),
+    coalesce(sum(user_message_tokens), 0),
+    coalesce(sum(response_tokens), 0),
+    coalesce(sum(total_tokens), 0),
+    coalesce(sum(actual_cost), 0),
+    coalesce(sum(naive_cost), 0),
+    coalesce(sum(cost_saved), 0),
+    coalesce(sum(savings_percent), 0)
+from cost_logs
+group by 1, 2, 3
+on conflict (user_id, day, model_used) do update set
+    queries                = excluded.queries,
+    memory_hits            = excluded.memory_hits,
+    working_memory_tokens  = excluded.working_memory_tokens,
+    episodic_memory_tokens = excluded.episodic_memory_tokens,
+    longterm_memory_tokens = excluded.longterm_memory_tokens,
+    user_message_tokens    = excluded.user_message_tokens,
+    response_tokens        = excluded.response_tokens,
+    total_tokens           = excluded.total_tokens,
+    actual_cost            = excluded.actual_cost,
+    naive_cost             = excluded.naive_cost,
+    cost_saved             = excluded.cost_saved,
+    savings_percent_sum    = excluded.savings_percent_sum;
+
+commit;
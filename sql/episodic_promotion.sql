@@ -0,0 +1,22 @@
+-- ── Users due for episodic → long-term promotion ─────────────
+-- The promotion sweep pages through these with keyset on user_id, so every
+-- user with old unarchived rows is reached no matter how many rows the
+-- heaviest users hold. Run once in the Supabase SQL editor.
+
+create index if not exists episodic_memories_unarchived_user_idx
+    on episodic_memories (user_id, created_at) where not is_archived;
+
+create or replace function users_with_old_episodic_memories(
+    cutoff      timestamptz,
+    after_user  episodic_memories.user_id%type default null,
+    page_size   int default 500
+) returns setof episodic_memories.user_id%type
+language sql stable as $$
+    select distinct user_id
+    from episodic_memories
+    where not is_archived
+      and created_at < cutoff
+      and (after_user is null or user_id > after_user)
+    order by user_id
+    limit page_size;
+$$;